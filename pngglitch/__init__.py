@@ -36,20 +36,153 @@ image and, thus, may render it unreadable. They should not be used.
 
 """
 
+import os
 import zlib
+import mmap
+import time
+import struct
+import binascii
+import tempfile
 import random
+import functools
+import itertools
+import collections
+import multiprocessing
 
 from .__pkginfo__ import author as __author__
 from .__pkginfo__ import copyright as __copyright__
 from .__pkginfo__ import license as __license__
 from .__pkginfo__ import version as __version__
 from .__pkginfo__ import credits as __credits__
+from . import deflate
+from .deflate import SegmentCache
 
 # TODO: Split into several modules. Turn glitch effects into functions or an
 # unrelated class that *operates* on PNG files instead of *being* a PNG file.
 # Allow streaming operation if possible.
 
 
+# Number of samples per pixel for each PNG color type.
+_CHANNELS_PER_COLOR_TYPE = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+# Offsets and strides (x0, y0, dx, dy) of the seven Adam7 passes.
+_ADAM7_PASSES = [
+    (0, 0, 8, 8),
+    (4, 0, 8, 8),
+    (0, 4, 4, 8),
+    (2, 0, 4, 4),
+    (0, 2, 2, 4),
+    (1, 0, 2, 2),
+    (0, 1, 1, 2),
+]
+
+# The maximum number of bytes to decompress in one step.
+_INFLATE_STEP = 1024 * 1024
+
+# Deflate expands its input by at most this factor.
+_MAX_DEFLATE_RATIO = 1032
+
+#: Ancillary chunks of at least this many bytes may be passed through.
+PASSTHROUGH_THRESHOLD = 64 * 1024
+
+# Chunks that are always read into memory because they are used.
+_ALWAYS_LOADED = {"IHDR", "IDAT", "IEND"}
+
+# The number of bytes that `PassthroughChunk` copies at once.
+_COPY_BLOCK_SIZE = 1024 * 1024
+
+#: The largest chunk payload allowed by the PNG specification.
+MAX_CHUNK_LENGTH = 2**31 - 1
+
+#: Decompressed image data of at least this many bytes is kept in a
+#: memory-mapped temporary file instead of a `bytearray`.
+MAP_THRESHOLD = 1024 * 1024 * 1024
+
+# The largest buffer that the zlib module of Python 2 compresses at once.
+_MAX_ZLIB_INPUT = 2**31 - 1
+
+
+class GlitchCancelled(Exception):
+    """Raised when a `CancellationToken` fires during glitching."""
+
+
+class ProgressEvent(
+        collections.namedtuple("ProgressEvent", ["stage", "done", "total"])):
+    """A report of progress made by a long-running operation.
+
+    See `PNGFile.progress`.
+
+    Attributes:
+        stage (str): The operation that made progress. One of ``"inflate"``
+            (decompression of the image data), ``"glitch"`` (application of
+            glitch effects), ``"deflate"`` (compression of the image data)
+            and ``"unpack"`` (putting glitched bytes back into their chunks
+            in raw mode, see `GlitchedPNGFile.begin_glitching()`).
+        done (int): The number of bytes processed so far in this stage.
+        total (int): The number of bytes to process in total in this stage,
+            or None if it is unknown.
+
+    """
+    __slots__ = ()
+
+
+class CancellationToken(object):
+    """A flag that tells long-running operations to stop early.
+
+    The token fires when `cancel()` is called, e.g. from another thread, or
+    when one of its deadlines passes. Operations that accept a token check it
+    at regular intervals and raise `GlitchCancelled` once it has fired.
+
+    Args:
+        timeout (*float*, optional): If passed, the token fires after this
+            many seconds of wall-clock time.
+        cpu_budget (*float*, optional): If passed, the token fires after this
+            process has used this many more seconds of CPU time.
+        parent (*CancellationToken*, optional): If passed, this token also
+            fires whenever `parent` fires.
+
+    """
+
+    def __init__(self, timeout=None, cpu_budget=None, parent=None):
+        self._cancelled = False
+        self._parent = parent
+        self._deadline = None
+        self._cpu_deadline = None
+        if timeout is not None:
+            self._deadline = time.time() + timeout
+        if cpu_budget is not None:
+            self._cpu_deadline = self._cpu_time() + cpu_budget
+
+    @staticmethod
+    def _cpu_time():
+        """Return the user and system time used by this process."""
+        times = os.times()
+        return times[0] + times[1]
+
+    def cancel(self):
+        """Make this token fire."""
+        self._cancelled = True
+
+    @property
+    def cancelled(self):
+        """bool: True if this token has fired."""
+        if self._cancelled:
+            return True
+        if self._parent is not None and self._parent.cancelled:
+            self._cancelled = True
+        elif self._deadline is not None and time.time() >= self._deadline:
+            self._cancelled = True
+        elif (self._cpu_deadline is not None
+              and self._cpu_time() >= self._cpu_deadline):
+            self._cancelled = True
+        return self._cancelled
+
+    def check(self):
+        """Raise `GlitchCancelled` if this token has fired."""
+        if self.cancelled:
+            raise GlitchCancelled()
+
+
 class Chunk(object):
     """Class representation of PNG chunks.
 
@@ -146,9 +279,14 @@ class Chunk(object):
         if not read_from_current:
             backup_pos = pngfile.tell()
             pngfile.seek(pos)
-        # Read information.
-        self.pos = pngfile.tell()
+        # Read information. Pipes and the like have no position.
+        try:
+            self.pos = pngfile.tell()
+        except IOError:
+            self.pos = 0
         self.length = _read_long_from_file(pngfile)
+        if self.length > MAX_CHUNK_LENGTH:
+            raise TypeError('invalid chunk length: {}'.format(self.length))
         self.name = pngfile.read(4).decode("ascii")
         self.raw_data = pngfile.read(self.length)
         self.crc = _read_long_from_file(pngfile)
@@ -227,6 +365,29 @@ class Chunk(object):
             self.set_long(self.crc),
         ], bytearray())
 
+    def iter_raw(self):
+        """Iterate over the serialized chunk in pieces.
+
+        Unlike `get_raw()`, this does not copy the payload.
+
+        Yields:
+            str: Length field and chunk type, the payload and the CRC.
+            Concatenated, they are the same as `get_raw()`.
+
+        """
+        yield self.set_long(self.length) + self.name.encode("ascii")
+        yield self.raw_data
+        yield self.set_long(self.crc)
+
+    def write_to(self, fileobj):
+        """Write the serialized chunk to a file object piece by piece.
+
+        See `iter_raw()`.
+
+        """
+        for data in self.iter_raw():
+            fileobj.write(data)
+
     def __str__(self):
         return '{name} chunk of length {length}, CRC: {crc}'.format(
             name=self.name, length=self.length, crc=hex(self.crc))
@@ -246,7 +407,9 @@ class Chunk(object):
             int: The checksum.
         """
         # TODO: The signature of crc32 changed in Python 3. See the docs.
-        return zlib.crc32(self.name.encode("ascii") + self.raw_data)
+        # Don't concatenate type and payload; the payload may be huge.
+        crc = zlib.crc32(self.name.encode("ascii"))
+        return zlib.crc32(self.raw_data, crc)
 
     def update_crc(self):
         """Update this chunk's CRC."""
@@ -293,16 +456,112 @@ class Chunk(object):
         return bool(self.length)
 
 
+class PassthroughChunk(Chunk):
+    """A chunk whose payload is left in its source file.
+
+    This saves memory for large chunks that are never modified, e.g. ICC
+    profiles or Exif data. The payload is read from the source file whenever
+    it is accessed. `iter_raw()` and `write_to()` copy it block by block
+    without ever holding all of it in memory.
+
+    Setting `data` turns this into an ordinary chunk that keeps its payload in
+    memory.
+
+    Note:
+        The source file must not change while this chunk is in use.
+
+    Args:
+        name (str): The 4-letter, case-sensitive chunk type.
+        source (str): The path of the file that contains the chunk.
+        pos (int): The position of the chunk in `source`.
+        length (int): The length of the chunk payload in bytes.
+        crc (int): The CRC of the chunk as stored in `source`.
+
+    Attributes:
+        source (str): The path of the file that contains the payload, or None
+            if the payload has been loaded into memory.
+    """
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, name, source, pos, length, crc):
+        if len(name) != 4:
+            raise TypeError('invalid chunk type: {}'.format(name))
+        self.name = name
+        self.source = source
+        self.pos = pos
+        self.length = length
+        self.crc = crc
+        self._raw_data = None
+
+    def copy(self):
+        """Copy this chunk. The copy refers to the same source file."""
+        new_chunk = type(self)(
+            self.name, self.source, self.pos, self.length, self.crc)
+        new_chunk._raw_data = self._raw_data
+        return new_chunk
+
+    @property
+    def raw_data(self):
+        """str: The payload of this chunk, read from `source` if necessary.
+
+        .. deprecated:: 1.1.0
+            Use the `data` property instead.
+        """
+        if self._raw_data is not None:
+            return self._raw_data
+        with open(self.source, "rb") as source_file:
+            source_file.seek(self.pos + 8)
+            return source_file.read(self.length)
+
+    @raw_data.setter
+    def raw_data(self, new_data):
+        self._raw_data = new_data
+        self.source = None
+
+    def load(self):
+        """Read the payload into memory for good."""
+        if self._raw_data is None:
+            self.raw_data = self.raw_data
+
+    def iter_raw(self):
+        """Iterate over the serialized chunk, reading the payload in blocks.
+
+        This never holds more than 1 MiB of the payload in memory.
+
+        """
+        if self._raw_data is not None:
+            for data in Chunk.iter_raw(self):
+                yield data
+            return
+        yield self.set_long(self.length) + self.name.encode("ascii")
+        with open(self.source, "rb") as source_file:
+            source_file.seek(self.pos + 8)
+            remaining = self.length
+            while remaining:
+                data = source_file.read(min(remaining, _COPY_BLOCK_SIZE))
+                if not data:
+                    raise IOError('source file has changed: {}'.format(
+                        self.source))
+                yield data
+                remaining -= len(data)
+        yield self.set_long(self.crc)
+
+
 class PNGFile(object):
     """Nice class representation of our beloved PNG files.
 
     Contains methods for chunk access, loading, and writing.
 
     Args:
-        image_name (*str*, optional): Path of a PNG file to load. If None or
-            not passed, an empty PNG file is created. This empty file contains
-            consists of a valid header and no chunks. (not even the mandatory
-            ``IEND`` chunk!)
+        image_name (*str or file*, optional): Path of a PNG file to load, or
+            a readable file object opened in binary mode, e.g. standard input.
+            If None or not passed, an empty PNG file is created. This empty
+            file contains consists of a valid header and no chunks. (not even
+            the mandatory ``IEND`` chunk!)
+        passthrough (bool): If True and `image_name` is a path, ancillary
+            chunks of at least `PASSTHROUGH_THRESHOLD` bytes are not read
+            into memory. Instead, they are copied straight from the source
+            file when written. (See `PassthroughChunk`.)
 
     Raises:
         TypeError: If the file given by `image_name` does not have a PNG
@@ -311,34 +570,82 @@ class PNGFile(object):
     Attributes:
         header (str): The magic PNG header.
         chunks (list(Chunk)): The chunks of this PNG file.
+        progress (callable): If not None, called with a `ProgressEvent`
+            whenever a long-running operation makes progress. Copies of this
+            file inherit it.
 
     """
 
     # --- Constructor --------------------------------------------------
 
-    def __init__(self, image_name=None):
+    def __init__(self, image_name=None, passthrough=False):
         magic_header = b'\x89PNG\r\n\x1a\n'
         self.chunks = []
+        self.progress = None
         if image_name is None:
             self.header = magic_header
             return
+        if hasattr(image_name, "read"):
+            self._read_chunks(image_name, magic_header)
+            return
         with open(image_name, "rb") as png_file:
-            self.header = png_file.read(8)
-            if self.header != magic_header:
-                raise TypeError('not a PNG file: {}'.format(image_name))
-            eof = False
-            while not eof:
+            self._read_chunks(
+                png_file, magic_header, image_name if passthrough else None)
+
+    def _read_chunks(self, png_file, magic_header, source=None):
+        """Read the header and all chunks from a file object.
+
+        If `source` is None, the file is read sequentially and never seeked,
+        so it may be a pipe. Otherwise, large ancillary chunks are skipped and
+        turned into `PassthroughChunks <PassthroughChunk>` that refer to the
+        path `source`.
+
+        """
+        self.header = png_file.read(8)
+        if self.header != magic_header:
+            name = getattr(png_file, "name", png_file)
+            raise TypeError('not a PNG file: {}'.format(name))
+        pos = len(self.header)
+        eof = False
+        while not eof:
+            if source is None:
                 new_chunk = Chunk.new_from_file(png_file)
-                self.chunks.append(new_chunk)
-                if new_chunk.name == "IEND":
-                    eof = True
+            else:
+                new_chunk = self._read_or_skip_chunk(png_file, source)
+            new_chunk.pos = pos
+            pos += 12 + len(new_chunk)
+            self.chunks.append(new_chunk)
+            if new_chunk.name == "IEND":
+                eof = True
+
+    @staticmethod
+    def _read_or_skip_chunk(png_file, source):
+        """Read the next chunk unless it should be passed through."""
+        pos = png_file.tell()
+        header = png_file.read(8)
+        length = Chunk.get_long(bytearray(header[:4]))
+        if length > MAX_CHUNK_LENGTH:
+            raise TypeError('invalid chunk length: {}'.format(length))
+        name = header[4:].decode("ascii")
+        if name in _ALWAYS_LOADED or length < PASSTHROUGH_THRESHOLD:
+            png_file.seek(pos)
+            return Chunk.new_from_file(png_file)
+        png_file.seek(length, os.SEEK_CUR)
+        crc = Chunk.get_long(bytearray(png_file.read(4)))
+        return PassthroughChunk(name, source, pos, length, crc)
 
     def copy(self):
         """Perform a deep copy of this file."""
         new_image = type(self)()
         new_image.chunks = [chunk.copy() for chunk in self.chunks]
+        new_image.progress = self.progress
         return new_image
 
+    def report_progress(self, stage, done, total):
+        """Call `progress` with a new `ProgressEvent`, if it is set."""
+        if self.progress is not None:
+            self.progress(ProgressEvent(stage, done, total))
+
     # --- Chunk Iterators ----------------------------------------------
 
     def idat_chunks(self):
@@ -362,40 +669,154 @@ class PNGFile(object):
 
     # --- Compression & Decompression ----------------------------------
 
-    def decompress(self):
+    def get_data_size(self):
+        """Compute the size of the decompressed image data from ``IHDR``.
+
+        This accounts for the filter-type byte of each scanline and for the
+        seven passes of Adam7-interlaced images.
+
+        Returns:
+            int: The number of bytes that the decompressed data must have, or
+            None if there is no valid ``IHDR`` chunk.
+
+        """
+        header = next(
+            (chunk for chunk in self.chunks if chunk.name == "IHDR"), None)
+        if header is None or len(header) != 13:
+            return None
+        width, height, bit_depth, color_type, _, _, interlace = struct.unpack(
+            ">IIBBBBB", bytes(header.data))
+        if color_type not in _CHANNELS_PER_COLOR_TYPE:
+            return None
+        bits_per_pixel = bit_depth * _CHANNELS_PER_COLOR_TYPE[color_type]
+
+        def image_size(width, height):
+            """The size of an image without interlacing."""
+            if width == 0 or height == 0:
+                return 0
+            return height * (1 + (width * bits_per_pixel + 7) // 8)
+
+        if not interlace:
+            return image_size(width, height)
+        return sum(
+            image_size((width - x0 + dx - 1) // dx,
+                       (height - y0 + dy - 1) // dy)
+            for x0, y0, dx, dy in _ADAM7_PASSES)
+
+    def decompress(self, mapped=None):
         """Get the decompressed image data.
 
-        This concatenates the data of all ``IDAT`` chunks and decompresses it,
-        but it does not unapply the PNG adaptive filter.
+        This decompresses the data of all ``IDAT`` chunks, but it does not
+        unapply the PNG adaptive filter.
+
+        If the size of the data is known from the ``IHDR`` chunk (see
+        `get_data_size()`), the result is allocated once and filled in small
+        steps. If the data is shorter than declared, the result is shortened
+        accordingly. No more is allocated up front than the ``IDAT`` chunks
+        can possibly expand to, so a bogus ``IHDR`` cannot exhaust memory.
+
+        Args:
+            mapped (*bool*, optional): If True, the result is an `mmap.mmap`
+                backed by an anonymous temporary file instead of a
+                `bytearray`. Its size cannot change, but it may be larger
+                than the available memory. If None or not passed, the data is
+                mapped if it may have at least `MAP_THRESHOLD` bytes.
+                Ignored if the size of the data is not known in advance.
+
+        Raises:
+            TypeError: If the data is longer than declared in ``IHDR``.
 
         """
-        buf = ''.join(chunk.data for chunk in self.idat_chunks())
-        return bytearray(zlib.decompress(buf))
+        decompressor = zlib.decompressobj()
+        size = self.get_data_size()
+        if size is None:
+            pieces = []
+            for chunk in self.idat_chunks():
+                pieces.append(decompressor.decompress(chunk.data))
+                self.report_progress("inflate", sum(map(len, pieces)), None)
+            pieces.append(decompressor.flush())
+            return bytearray(b"".join(pieces))
+        compressed_size = sum(len(chunk) for chunk in self.idat_chunks())
+        capacity = min(
+            size, _MAX_DEFLATE_RATIO * compressed_size + _INFLATE_STEP)
+        if mapped is None:
+            mapped = capacity >= MAP_THRESHOLD
+        if mapped and capacity:
+            buf = _MappedBuffer.new(capacity)
+        else:
+            buf = bytearray(capacity)
+        pos = 0
+        for chunk in self.idat_chunks():
+            data = chunk.data
+            while data:
+                # Allow one byte too many to detect oversized data.
+                max_length = min(size - pos + 1, _INFLATE_STEP)
+                piece = decompressor.decompress(data, max_length)
+                buf = _store_piece(buf, pos, piece, size)
+                pos += len(piece)
+                data = decompressor.unconsumed_tail
+                self.report_progress("inflate", pos, size)
+        piece = decompressor.flush()
+        buf = _store_piece(buf, pos, piece, size)
+        pos += len(piece)
+        if isinstance(buf, bytearray):
+            del buf[pos:]
+        elif pos == 0:
+            buf = bytearray()
+        elif pos < len(buf):
+            buf.resize(pos)
+        self.report_progress("inflate", pos, pos)
+        return buf
 
     @staticmethod
-    def buffer_to_chunks(buf, chunk_size):
+    def buffer_to_chunks(buf, chunk_size, compress=None):
         """Compresses a buffer and packs it into equally-sized ``IDAT`` chunks.
 
         Args:
             buf (str): The uncompressed string of bytes to pack into chunks.
             chunk_size (int): How many bytes (after compression) to pack into a
-                single chunk. The final chunk may have a different size.
+                single chunk. The final chunk may have a different size. This
+                is limited to `MAX_CHUNK_LENGTH`.
+            compress (*callable*, optional): A function that turns `buf` into
+                a zlib stream, either as one string or as an iterable of
+                consecutive pieces. Defaults to `zlib.compress()`, or to
+                `pngglitch.deflate.iter_compress()` for buffers that are too
+                large for `zlib.compress()`.
 
         Returns:
             list(Chunk): The ``IDAT`` chunks created from the data. Because
             each of them is made out of thin air, the `pos` attribute of each
             is 0.
         """
-        buf = zlib.compress(buffer(buf))
-        chunk_count = (
-            len(buf) / chunk_size + (1 if len(buf) % chunk_size else 0))
+        if compress is None and len(buf) > _MAX_ZLIB_INPUT:
+            compress = deflate.iter_compress
+        if compress is None:
+            pieces = [zlib.compress(buffer(buf))]
+        else:
+            pieces = compress(buf)
+            if isinstance(pieces, (str, bytearray)):
+                pieces = [pieces]
+        chunk_size = min(max(chunk_size, 1), MAX_CHUNK_LENGTH)
         new_chunks = []
-        for i in xrange(chunk_count):
-            data = buf[i * chunk_size:(i + 1) * chunk_size]
-            new_chunks.append(Chunk("IDAT", data))
+        pending = []
+        pending_size = 0
+        # Pieces may be much smaller or much larger than a chunk.
+        for piece in pieces:
+            offset = 0
+            while offset < len(piece):
+                length = min(len(piece) - offset, chunk_size - pending_size)
+                pending.append(bytes(piece[offset:offset + length]))
+                pending_size += length
+                offset += length
+                if pending_size == chunk_size:
+                    new_chunks.append(Chunk("IDAT", b"".join(pending)))
+                    pending = []
+                    pending_size = 0
+        if pending:
+            new_chunks.append(Chunk("IDAT", b"".join(pending)))
         return new_chunks
 
-    def overload(self, buf):
+    def overload(self, buf, compress=None):
         """Forget the old image data and replace it with buf.
 
         This removes all ``IDAT`` and ``IEND`` chunks, but retains the rest. It
@@ -404,16 +825,52 @@ class PNGFile(object):
 
         Args:
             buf (str): The image data that replaces this file's current data.
+            compress (*callable*, optional): Passed to `buffer_to_chunks()`.
 
         """
         chunk_size = len(next(self.idat_chunks()))
         new_chunks = list(self.various_chunks())
-        new_chunks.extend(self.buffer_to_chunks(buf, chunk_size))
+        new_chunks.extend(self.buffer_to_chunks(buf, chunk_size, compress))
         new_chunks.append(Chunk("IEND"))
         self.chunks = new_chunks
 
     # --- Writing to Disk ----------------------------------------------
 
+    def iter_raw(self):
+        """Iterate over the serialized parts of this file.
+
+        Yields:
+            str: First the magic PNG header, then the pieces of each chunk as
+            yielded by `Chunk.iter_raw()`. Concatenated, they form the whole
+            file. Payloads of `PassthroughChunks <PassthroughChunk>` are
+            read from their source file block by block.
+
+        """
+        yield self.header
+        for chunk in self.chunks:
+            for data in chunk.iter_raw():
+                yield data
+
+    def get_size(self):
+        """Return the size of this file when serialized, in bytes.
+
+        This does not serialize any chunks.
+
+        """
+        # Each chunk has 12 bytes for length, chunk type and CRC.
+        return len(self.header) + sum(12 + len(chunk) for chunk in self.chunks)
+
+    def write_to(self, fileobj):
+        """Write this PNG file to a file object chunk by chunk.
+
+        Args:
+            fileobj (file): A writable file object opened in binary mode. It
+                does not need to be seekable.
+        """
+        fileobj.write(self.header)
+        for chunk in self.chunks:
+            chunk.write_to(fileobj)
+
     def write(self, name):
         """Write this PNG file to disk.
 
@@ -421,10 +878,15 @@ class PNGFile(object):
             name (str): The path to the file to write. If the file already
                 exists, it is overwritten.
         """
-        with open(name, "wb") as pngfile:
-            pngfile.write(self.header)
+        if os.path.exists(name):
+            # Don't truncate the file that passed-through chunks come from.
             for chunk in self.chunks:
-                pngfile.write(chunk.get_raw())
+                if (isinstance(chunk, PassthroughChunk)
+                        and chunk.source is not None
+                        and os.path.samefile(chunk.source, name)):
+                    chunk.load()
+        with open(name, "wb") as pngfile:
+            self.write_to(pngfile)
 
 
 class GlitchedPNGFile(PNGFile):
@@ -443,36 +905,160 @@ class GlitchedPNGFile(PNGFile):
         ...     # output.write('output.%d.png' % i)  # To save each file.
 
     Args:
-        image_name (str): Path to the PNG file to load. If None or not passed,
-            this creates an empty PNG file. This file has a valid header, but
-            no chunks. (not even the mandatory ``IEND``!)
+        image_name (str or file): Path to the PNG file to load or a readable
+            file object. If None or not passed, this creates an empty PNG
+            file. This file has a valid header, but no chunks. (not even the
+            mandatory ``IEND``!)
+        passthrough (bool): Passed to `PNGFile`.
+
+    Attributes:
+        rng (random.Random): The source of randomness for all glitch effects.
+            Defaults to the `random` module itself, i.e. the global generator.
+            Assign a `random.Random` instance to get reproducible results.
+        threads (int): The number of threads that compress the image data in
+            `end_glitching()`. This only affects the speed, never the
+            output. Defaults to 1.
     """
 
     # --- Actually Important Methods -----------------------------------
 
-    def __init__(self, image_name=None):
-        PNGFile.__init__(self, image_name)
+    def __init__(self, image_name=None, passthrough=False):
+        PNGFile.__init__(self, image_name, passthrough)
+        self.rng = random
+        self.threads = 1
         self._decompressed = None
+        self._baseline = None
+        self._raw_chunks = None
+
+    def copy(self):
+        """Perform a deep copy of this file.
+
+        The copy shares the cached decompressed data (see `get_baseline()`)
+        with this file, but not the random number generator.
+
+        """
+        new_image = PNGFile.copy(self)
+        new_image.threads = self.threads
+        new_image._baseline = self._baseline
+        return new_image
+
+    def get_baseline(self):
+        """Get the decompressed data of this file and keep it around.
+
+        Unlike `~PNGFile.decompress()`, this inflates the image data only on
+        the first call. All copies made afterwards share the result, so that
+        `begin_glitching()` does not have to decompress again.
 
-    def begin_glitching(self):
+        Returns:
+            bytearray: The decompressed image data. Do not modify it. If it
+            has at least `MAP_THRESHOLD` bytes, this is an `mmap.mmap`
+            instead. (See `~PNGFile.decompress()`.)
+
+        """
+        if self._baseline is None:
+            self._baseline = self.decompress()
+        return self._baseline
+
+    def begin_glitching(self, raw_chunks=None):
         """Prepare the file for applying glitches.
 
         This must be called before any other glitching method.
 
-        """
-        self._decompressed = self.decompress()
+        If the cached decompressed data is memory-mapped, the glitches are
+        applied to a copy-on-write mapping of it. Only the pages that are
+        actually glitched take up memory.
+
+        Args:
+            raw_chunks (*set(str)*, optional): If passed, the image data is
+                not decompressed. Instead, the glitches are applied directly
+                to the payloads of all chunks of these types, e.g.
+                ``{"IDAT"}`` for the compressed image data. This is much
+                faster, but most glitches will make the image data invalid.
+
+        Raises:
+            ValueError: If `raw_chunks` is passed, but no chunk of these
+                types has a payload.
 
-    def end_glitching(self):
+        """
+        if raw_chunks is not None:
+            chunks = [chunk for chunk in self.chunks
+                      if chunk.name in raw_chunks]
+            if not any(len(chunk) for chunk in chunks):
+                raise ValueError("no data in chunks of type {}".format(
+                    ",".join(sorted(raw_chunks))))
+            self._raw_chunks = chunks
+            self._decompressed = bytearray().join(
+                chunk.data for chunk in chunks)
+        elif self._baseline is None:
+            self._decompressed = self.decompress()
+        elif isinstance(self._baseline, _MappedBuffer):
+            self._decompressed = self._baseline.private_copy()
+        else:
+            self._decompressed = bytearray(self._baseline)
+
+    def end_glitching(self, compress=None, cancel=None):
         """Stop applying glitches and pack the file into chunks again.
 
         This must be called after glitching the file. Only then the glitches
         will actually persist.
 
+        Args:
+            compress (*callable*, optional): Passed to `~PNGFile.overload()`.
+                If not passed, the data is compressed by
+                `pngglitch.deflate.iter_compress()` with `threads` threads
+                and progress is reported to `~PNGFile.progress`. The
+                compressed data is packed into chunks as it is produced. The
+                result is the same for any number of threads.
+            cancel (*CancellationToken*, optional): If passed and `compress`
+                is not, it is checked between compressed segments.
+
+        In raw mode (see `begin_glitching()`), the glitched bytes are put back
+        into the chunks they came from. Only the CRCs of these chunks are
+        updated; nothing is compressed.
+
+        Raises:
+            GlitchCancelled: If `cancel` fires.
+
         """
-        self.overload(self._decompressed)
+        if self._raw_chunks is not None:
+            self._unpack_raw_chunks()
+            return
+        if compress is None:
+            # Always compress the same way, so that the output of a seed
+            # does not depend on how the work is done.
+            compress = functools.partial(
+                deflate.iter_compress,
+                threads=self.threads,
+                cancel=cancel,
+                progress=functools.partial(self.report_progress, "deflate"),
+            )
+        self.overload(self._decompressed, compress)
+        if isinstance(self._decompressed, _MappedBuffer):
+            self._decompressed.close()
         self._decompressed = None
+        self._baseline = None
+
+    def _unpack_raw_chunks(self):
+        """Split the glitched raw data up into its chunks again.
+
+        If the data has changed its length, the last chunk absorbs the
+        difference. Reports a single ``"unpack"`` progress event.
 
-    def random_glitches(self, glitch_amount, glitch_size, glitch_dev):
+        """
+        data = self._decompressed
+        pos = 0
+        last = len(self._raw_chunks) - 1
+        for i, chunk in enumerate(self._raw_chunks):
+            end = len(data) if i == last else pos + len(chunk)
+            chunk.data = bytes(data[pos:end])
+            pos = end
+        self.report_progress("unpack", len(data), len(data))
+        self._raw_chunks = None
+        self._decompressed = None
+        self._baseline = None
+
+    def random_glitches(self, glitch_amount, glitch_size, glitch_dev,
+                        cancel=None):
         """Apply a random choice of glitch effects to the image data.
 
         The exact details of the algorithm are intentionally left unspecified.
@@ -488,54 +1074,276 @@ class GlitchedPNGFile(PNGFile):
                 concentrate the glitch effect into larger contiguous sections.
             glich_dev (float): Glitch size standard deviation in bytes. Higher
                 values will make the glitch size fluctuate more wildly.
+            cancel (*CancellationToken*, optional): If passed, it is checked
+                before each glitch effect.
+
+        The effects are picked from `EFFECTS` according to their weights.
+        All picks are made first. Then, effects that preserve the length of
+        the image data are applied, each effect in one batch. Effects that
+        change the length of the data, and thus have to move everything
+        behind the glitch, come last. They are never picked if the image data
+        is memory-mapped (see `~PNGFile.decompress()`) or in raw mode (see
+        `begin_glitching()`). No single glitch is longer than the image data.
+
+        Raises:
+            GlitchCancelled: If `cancel` fires. The effects applied so far
+                remain in place.
+            ValueError: If no registered effect can be applied, e.g. because
+                all weights are 0, or if there is no image data.
 
         """
-        method_list = (4 * [self.fill_noise] + 3 * [self.fill_zeros] +
-                       [self.move, self.switch])
+        resizable = (isinstance(self._decompressed, bytearray)
+                     and self._raw_chunks is None)
+        choices = [effect for effect in EFFECTS.values()
+                   if resizable or effect.preserves_length
+                   for _ in range(effect.weight)]
+        if glitch_amount > 0 and not choices:
+            raise ValueError('no glitch effect is applicable: all weights '
+                             'are 0 or all effects change the data length')
+        size = len(self._decompressed)
+        if glitch_amount > 0 and not size:
+            raise ValueError("there is no image data to glitch")
+        batches = collections.OrderedDict()
         while glitch_amount > 0:
-            amount = int(random.gauss(glitch_size, glitch_dev))
-            amount = min(max(amount, 2), glitch_amount)
+            amount = int(self.rng.gauss(glitch_size, glitch_dev))
+            amount = min(max(amount, 2), glitch_amount, size)
             glitch_amount -= amount
-            random.choice(method_list)(amount)
+            effect = self.rng.choice(choices)
+            batches.setdefault(effect.name, (effect, []))[1].append(amount)
+        batches = sorted(batches.values(),
+                         key=lambda batch: not batch[0].preserves_length)
+        total = sum(sum(lengths) for _, lengths in batches)
+        done = 0
+        for effect, lengths in batches:
+            if effect.bulk is not None:
+                if cancel is not None:
+                    cancel.check()
+                effect.bulk(self, lengths)
+                done += sum(lengths)
+                self.report_progress("glitch", done, total)
+                continue
+            for length in lengths:
+                if cancel is not None:
+                    cancel.check()
+                effect.function(self, length)
+                done += length
+                self.report_progress("glitch", done, total)
+
+    def glitch_copy(self, glitch_amount, glitch_size, glitch_dev, seed=None,
+                    cancel=None, raw_chunks=None):
+        """Produce a single glitched PNG file from this one.
+
+        Args:
+            glitch_amount (int): Passed to `random_glitches()`.
+            glitch_size (float): Passed to `random_glitches()`.
+            glitch_dev (float): Passed to `random_glitches()`.
+            seed (*int*, optional): If passed, the glitches are produced by a
+                new `random.Random` seeded with this value. The same seed
+                applied to the same file always gives the same result.
+                Otherwise, `rng` is used.
+            cancel (*CancellationToken*, optional): If passed, it is checked
+                between glitch effects and between compressed segments.
+            raw_chunks (*set(str)*, optional): Passed to `begin_glitching()`.
 
-    def glitch_file(self, glitch_amount, glitch_size, glitch_dev, copies=1):
+        Returns:
+            GlitchedPNGFile: A copy of this file with glitches applied. This
+            file itself is left unmodified.
+
+        Raises:
+            GlitchCancelled: If `cancel` fires. The half-finished copy is
+                discarded.
+
+        """
+        copy = self.copy()
+        copy.rng = self.rng if seed is None else random.Random(seed)
+        try:
+            copy.begin_glitching(raw_chunks)
+            copy.random_glitches(glitch_amount, glitch_size, glitch_dev,
+                                 cancel)
+            copy.end_glitching(cancel=cancel)
+        except GlitchCancelled:
+            # Don't wait for the garbage collector to release the buffer.
+            copy._decompressed = None
+            raise
+        return copy
+
+    def glitch_file(self, glitch_amount, glitch_size, glitch_dev, copies=1,
+                    raw_chunks=None):
         """Produce glitched PNG files from this one.
 
         This returns an iterator over glitched PNG files. Each file is produced
         by calling `random_glitches()` on the unmodified version of this file.
+        The image data is decompressed only once for all copies.
 
         Args:
             glitch_amount (int): Passed to `random_glitches()`.
             glitch_size (float): Passed to `random_glitches()`.
             glitch_dev (float): Passed to `random_glitches()`.
             copies (int): The number of glitched PNG files to produce.
+            raw_chunks (*set(str)*, optional): Passed to `begin_glitching()`.
+                If passed, the image data is not decompressed at all.
 
         Yields:
             GlitchedPNGFile: A copy of this file with glitches applied. This
             file itself is left unmodified.
 
         """
+        if raw_chunks is None:
+            self.get_baseline()
         for _ in range(copies):
-            copy = self.copy()
-            copy.begin_glitching()
-            copy.random_glitches(glitch_amount, glitch_size, glitch_dev)
-            copy.end_glitching()
+            yield self.glitch_copy(glitch_amount, glitch_size, glitch_dev,
+                                   raw_chunks=raw_chunks)
+
+    def glitch_sequence(self, glitch_amount, glitch_size, glitch_dev, frames,
+                        seed=None):
+        """Produce a sequence of increasingly glitched PNG files.
+
+        The first file is made like in `glitch_file()`. Each following file is
+        its predecessor with another `glitch_amount` bytes glitched. This is
+        useful to make animations in which the image falls apart gradually.
+
+        Only the new glitches are applied for each file and only those parts
+        of the image data that changed are compressed again. (See
+        `~pngglitch.deflate.SegmentCache`.) Thus, the cost of the whole
+        sequence grows with the total number of glitches, not with the
+        square of `frames`.
+
+        Args:
+            glitch_amount (int): Passed to `random_glitches()` for each file.
+            glitch_size (float): Passed to `random_glitches()`.
+            glitch_dev (float): Passed to `random_glitches()`.
+            frames (int): The number of PNG files to produce.
+            seed (*int*, optional): If passed, the glitches are produced by a
+                new `random.Random` seeded with this value. Otherwise, `rng`
+                is used.
+
+        Yields:
+            GlitchedPNGFile: The glitched files in order. This file itself is
+            left unmodified.
+
+        """
+        work = self.copy()
+        work.rng = self.rng if seed is None else random.Random(seed)
+        work.begin_glitching()
+        cache = SegmentCache()
+        for _ in range(frames):
+            work.random_glitches(glitch_amount, glitch_size, glitch_dev)
+            frame = self.copy()
+            frame.overload(work._decompressed, cache.compress)
+            frame._baseline = None
+            yield frame
+
+    def glitch_until(self, glitch_amount, glitch_size, glitch_dev,
+                     timeout=None, cpu_budget=None, cancel=None):
+        """Produce glitched PNG files until time runs out.
+
+        This works like `glitch_file()`, but instead of a fixed number of
+        copies, it produces as many as it can within the given budget. The
+        copy that is in progress when the budget runs out is abandoned. If no
+        budget and no `cancel` token is passed, the iterator never stops.
+
+        Args:
+            glitch_amount (int): Passed to `random_glitches()`.
+            glitch_size (float): Passed to `random_glitches()`.
+            glitch_dev (float): Passed to `random_glitches()`.
+            timeout (*float*, optional): Wall-clock time in seconds, counted
+                from this call.
+            cpu_budget (*float*, optional): CPU time of this process in
+                seconds, counted from this call.
+            cancel (*CancellationToken*, optional): A token that stops the
+                iteration when it fires.
+
+        Yields:
+            GlitchedPNGFile: A copy of this file with glitches applied. This
+            file itself is left unmodified.
+
+        """
+        token = CancellationToken(timeout, cpu_budget, parent=cancel)
+        self.get_baseline()
+        while True:
+            try:
+                copy = self.glitch_copy(glitch_amount, glitch_size, glitch_dev,
+                                        cancel=token)
+            except GlitchCancelled:
+                return
             yield copy
 
+    def sweep(self, amounts, sizes, devs, copies=1, seed=None, processes=1):
+        """Produce glitched PNG files for a grid of glitch parameters.
+
+        This calls `glitch_copy()` for every combination of the passed
+        parameters, `copies` times each. The image data is decompressed only
+        once; all copies start from the same decoded baseline.
+
+        Every copy gets its own seed, which is drawn from a generator seeded
+        with `seed`. Passing the seed of a copy and its parameters to
+        `glitch_copy()` reproduces that copy exactly.
+
+        Args:
+            amounts (list(int)): The values to try for `glitch_amount`.
+            sizes (list(float)): The values to try for `glitch_size`.
+            devs (list(float)): The values to try for `glitch_dev`.
+            copies (int): The number of glitched PNG files to produce for each
+                combination of parameters.
+            seed (*int*, optional): Seed from which the per-copy seeds are
+                derived. If not passed, `rng` is used to draw them.
+            processes (int): The number of worker processes that produce the
+                copies. If 1, all work is done in the current process.
+
+        Yields:
+            tuple(SweepParams, GlitchedPNGFile): The parameters of each copy
+            and the copy itself, in the order of the grid. (amounts vary
+            slowest, copies fastest.)
+
+        """
+        seeder = self.rng if seed is None else random.Random(seed)
+        grid = [
+            SweepParams(amount, size, dev, index, seeder.getrandbits(32))
+            for amount in amounts
+            for size in sizes
+            for dev in devs
+            for index in range(copies)
+        ]
+        baseline = self.get_baseline()
+        if processes == 1:
+            for params in grid:
+                yield params, self.glitch_copy(
+                    params.amount, params.size, params.dev, params.seed)
+            return
+        pool = multiprocessing.Pool(
+            processes,
+            initializer=_init_sweep_worker,
+            initargs=(self.chunks, baseline, self.threads),
+        )
+        try:
+            results = pool.imap(_sweep_worker, grid)
+            for params, chunks in itertools.izip(grid, results):
+                copy = type(self)()
+                copy.header = self.header
+                copy.chunks = chunks
+                yield params, copy
+        finally:
+            pool.terminate()
+
     # --- Internal Stuff (Better Not Call Directly) --------------------
 
     @staticmethod
-    def random_bytes(length):
+    def random_bytes(length, rng=random):
         """Produce an array of random bytes.
 
         Args:
             length (int): The number of bytes to produce.
+            rng (*random.Random*, optional): The random number generator to
+                use. Defaults to the global one.
 
         Returns:
             bytearray: Random bytes.
 
         """
-        return bytearray(random.randint(0, 255) for i in range(length))
+        if length <= 0:
+            return bytearray()
+        bits = rng.getrandbits(8 * length)
+        return bytearray(binascii.unhexlify("%0*x" % (2 * length, bits)))
 
     def _insert(self, pos, ins):
         """Insert bytes into the image data.
@@ -578,9 +1386,10 @@ class GlitchedPNGFile(PNGFile):
             rep (str): The bytes to write over the image data.
 
         """
-        length = len(self._decompressed)
-        self._decompressed[pos:pos + len(rep)] = rep
-        del self._decompressed[length:]
+        data = self._decompressed
+        end = min(pos + len(rep), len(data))
+        if end > pos:
+            data[pos:end] = bytes(rep[:end - pos])
 
     def fill_noise(self, length, pos=None):
         """Replace image data with random bytes.
@@ -597,29 +1406,58 @@ class GlitchedPNGFile(PNGFile):
 
         """
         if pos is None:
-            pos = random.randint(0, len(self._decompressed) - length)
-        self.replace(pos, self.random_bytes(length))
+            pos = self.rng.randint(0, len(self._decompressed) - length)
+        self.replace(pos, self.random_bytes(length, self.rng))
+
+    def fill_noise_bulk(self, lengths):
+        """Apply `fill_noise()` several times at random positions.
+
+        This draws the noise for all glitches at once.
+
+        Args:
+            lengths (list(int)): The number of bytes to overwrite per glitch.
+
+        """
+        noise = self.random_bytes(sum(lengths), self.rng)
+        offset = 0
+        for length in lengths:
+            pos = self.rng.randint(0, len(self._decompressed) - length)
+            self.replace(pos, buffer(noise, offset, length))
+            offset += length
 
     def fill_zeros(self, length, pos=None):
         """Like `fill_noise()` but overwrite bytes with zeros."""
         if pos is None:
-            pos = random.randint(0, len(self._decompressed) - length)
+            pos = self.rng.randint(0, len(self._decompressed) - length)
         self.replace(pos, length * '\x00')
 
     def move(self, length, from_=None, to_=None):
         """Move a block of image data from one place to another.
 
+        This has the same result as cutting out the block and reinserting it,
+        but only touches the bytes between the two positions. Apart from the
+        block itself, it needs no more than a constant amount of memory.
+
         Args:
             length (int): The number of bytes to move.
             from_ (*int*, optional): The position at which to cut out bytes.
             to_ (*int*, optional): The position at which to reinsert the bytes.
 
         """
+        data = self._decompressed
         if from_ is None:
-            from_ = random.randint(0, len(self._decompressed) - length)
+            from_ = self.rng.randint(0, len(data) - length)
         if to_ is None:
-            to_ = random.randint(0, len(self._decompressed) - length)
-        self._insert(to_, self._remove(from_, length))
+            to_ = self.rng.randint(0, len(data) - length)
+        length = max(0, min(length, len(data) - from_))
+        to_ = min(to_, len(data) - length)
+        block = bytes(data[from_:from_ + length])
+        if to_ > from_:
+            _shift(data, from_, from_ + length, to_ - from_)
+            data[to_:to_ + length] = block
+        elif to_ < from_:
+            _shift(data, to_ + length, to_, from_ - to_)
+            data[to_:to_ + length] = block
 
     def switch(self, len_one, pos_one=None, len_two=None, pos_two=None):
         """Switch two blocks of image data with each other.
@@ -637,15 +1475,15 @@ class GlitchedPNGFile(PNGFile):
 
         """
         if len_two is None:
-            len_two = random.randint(1, len_one)
+            len_two = self.rng.randint(1, len_one)
             len_one -= len_two
         if pos_one is None:
-            pos_one = random.randint(
+            pos_one = self.rng.randint(
                 0,
                 len(self._decompressed) - len_one - len_two,
             )
         if pos_two is None:
-            pos_two = random.randint(
+            pos_two = self.rng.randint(
                 pos_one + len_one,
                 len(self._decompressed) - len_two,
             )
@@ -655,3 +1493,154 @@ class GlitchedPNGFile(PNGFile):
         assert pos_one + len_one <= pos_two
         self.move(len_two, pos_two, pos_one + len_one)
         self.move(len_one, pos_one, pos_two)
+
+
+class SweepParams(
+        collections.namedtuple(
+            "SweepParams", ["amount", "size", "dev", "index", "seed"])):
+    """The parameters of one copy produced by `GlitchedPNGFile.sweep()`.
+
+    `index` counts the copies made with the same `amount`, `size` and `dev`,
+    starting at 0.
+
+    """
+    __slots__ = ()
+
+
+# The file shared by all processes of a `GlitchedPNGFile.sweep()`.
+_SWEEP_SOURCE = None
+
+
+def _init_sweep_worker(chunks, baseline, threads):
+    """Receive the unglitched file in a worker process."""
+    global _SWEEP_SOURCE  # pylint: disable=global-statement
+    _SWEEP_SOURCE = GlitchedPNGFile()
+    _SWEEP_SOURCE.chunks = chunks
+    _SWEEP_SOURCE.threads = threads
+    _SWEEP_SOURCE._baseline = baseline  # pylint: disable=protected-access
+
+
+def _sweep_worker(params):
+    """Produce one copy of a sweep in a worker process."""
+    copy = _SWEEP_SOURCE.glitch_copy(
+        params.amount, params.size, params.dev, params.seed)
+    return copy.chunks
+
+
+def _store_piece(buf, pos, piece, size):
+    """Write decompressed data into `buf`, growing it up to `size` bytes.
+
+    Returns:
+        The buffer that holds the data, i.e. `buf`.
+
+    Raises:
+        TypeError: If the data would exceed `size` bytes.
+
+    """
+    end = pos + len(piece)
+    if end > size:
+        raise TypeError('image data exceeds the size declared '
+                        'in IHDR: {} bytes'.format(size))
+    if end > len(buf):
+        if isinstance(buf, bytearray):
+            del buf[pos:]
+            buf.extend(piece)
+            return buf
+        buf.resize(min(size, max(end, 2 * len(buf))))
+    buf[pos:end] = piece
+    return buf
+
+
+class _MappedBuffer(mmap.mmap):
+    """A memory map of an anonymous temporary file.
+
+    Use `new()` to create one. The file is deleted when it is no longer used.
+
+    """
+
+    @classmethod
+    def new(cls, size):
+        """Create a file of `size` zero bytes and map it."""
+        tmp = tempfile.TemporaryFile()
+        tmp.truncate(size)
+        buf = cls(tmp.fileno(), size)
+        buf.file = tmp
+        return buf
+
+    def private_copy(self):
+        """Map the same file again, but don't write changes back to it."""
+        buf = _MappedBuffer(self.file.fileno(), 0, access=mmap.ACCESS_COPY)
+        buf.file = self.file
+        return buf
+
+
+def _shift(data, dest, src, count):
+    """Copy `count` bytes inside `data` from `src` to `dest`.
+
+    The ranges may overlap. Large ranges are copied block by block, so that no
+    big temporary copies are made.
+
+    """
+    if isinstance(data, mmap.mmap):
+        data.move(dest, src, count)
+        return
+    offsets = xrange(0, count, _COPY_BLOCK_SIZE)
+    if dest > src:
+        # Copy back to front so that no byte is overwritten before it's read.
+        offsets = reversed(offsets)
+    for offset in offsets:
+        length = min(_COPY_BLOCK_SIZE, count - offset)
+        data[dest + offset:dest + offset + length] = \
+            data[src + offset:src + offset + length]
+
+
+class Effect(
+        collections.namedtuple(
+            "Effect",
+            ["name", "function", "weight", "preserves_length", "bulk"])):
+    """A glitch effect that `GlitchedPNGFile.random_glitches()` may pick.
+
+    Attributes:
+        name (str): The unique name of the effect.
+        function (callable): Called as ``function(pngfile, length)`` to apply
+            the effect to `length` bytes of a `GlitchedPNGFile` between
+            `~GlitchedPNGFile.begin_glitching()` and
+            `~GlitchedPNGFile.end_glitching()`.
+        weight (int): How likely the effect is picked compared to the others.
+        preserves_length (bool): False if the effect may change the length of
+            the image data. Such effects have to move all data behind the
+            glitch in memory and are applied after all other effects.
+        bulk (callable): If not None, called as ``bulk(pngfile, lengths)`` to
+            apply the effect once for each item of `lengths`. This should be
+            faster than calling `function` repeatedly.
+
+    """
+    __slots__ = ()
+
+
+#: The registered glitch effects by name, in order of registration.
+EFFECTS = collections.OrderedDict()
+
+
+def register_effect(name, function, weight=1, preserves_length=True,
+                    bulk=None):
+    """Add a glitch effect to `EFFECTS` or replace an existing one.
+
+    See `Effect` for the meaning of the arguments. To stop an effect from
+    being picked, either remove it from `EFFECTS` or register it again with a
+    weight of 0.
+
+    Returns:
+        Effect: The new effect.
+
+    """
+    effect = Effect(name, function, weight, preserves_length, bulk)
+    EFFECTS[name] = effect
+    return effect
+
+
+register_effect("fill_noise", GlitchedPNGFile.fill_noise, weight=4,
+                bulk=GlitchedPNGFile.fill_noise_bulk)
+register_effect("fill_zeros", GlitchedPNGFile.fill_zeros, weight=3)
+register_effect("move", GlitchedPNGFile.move)
+register_effect("switch", GlitchedPNGFile.switch)
@@ -17,13 +17,17 @@
 """The command-line script that is part of `pngglitch`."""
 
 import os
+import sys
+import json
+import time
 import random
 import argparse
 
-from pngglitch import GlitchedPNGFile
+from pngglitch import GlitchedPNGFile, manifest
+from pngglitch.sinks import open_sink, DirectorySink, StreamSink
 
 
-def parse_args():
+def parse_args(argv=None):
     """Interface to the command-line."""
 
     def insert_index_into_filename(filename):
@@ -49,10 +53,12 @@ def parse_args():
         dest="outfile",
         action="store",
         type=str,
-        help="Naming pattern for the output files. Defaults to "
-        "<infile>.%%d.png if --num is specified and to "
-        "<infile>.corrupt.png otherwise.",
+        help="Naming pattern for the output files. Pass - to write to "
+        "standard output. Defaults to <infile>.%%d.png if --num is specified "
+        "and to <infile>.corrupt.png otherwise. If INFILE is -, defaults to "
+        "standard output.",
     )
+    add_archive_argument(parser)
     parser.add_argument(
         "--num",
         "-N",
@@ -103,26 +109,58 @@ def parse_args():
         help="Standard deviation of glitch size in bytes. "
         "Defaults to 5.",
     )
+    add_threads_argument(parser)
+    parser.add_argument(
+        "--passthrough",
+        dest="passthrough",
+        action="store_true",
+        default=False,
+        help="Don't load large metadata chunks (e.g. ICC profiles) into "
+        "memory, but copy them from INFILE when writing output files.",
+    )
+    parser.add_argument(
+        "--raw",
+        dest="raw",
+        metavar="TYPES",
+        action="store",
+        type=str,
+        help="Don't decompress the image data, but glitch the payloads of "
+        "the given comma-separated chunk types directly, e.g. IDAT for the "
+        "compressed image data. Much faster, but the output is rarely a "
+        "valid image.",
+    )
+    add_progress_argument(parser)
     parser.add_argument(
         "infile",
         metavar="INFILE",
         action="store",
         type=str,
-        help="PNG file to be corrupted.",
+        help="PNG file to be corrupted. Pass - to read from standard input.",
     )
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.threads < 1:
+        parser.error("--threads must be at least 1")
+    if args.raw is not None and any(
+            len(name) != 4 for name in args.raw.split(",")):
+        parser.error("--raw expects 4-letter chunk types")
 
     # Sanitize output filename.
+    if args.outfile is None and args.infile == "-" and args.archive is None:
+        # piped input, piped output.
+        args.outfile = "-"
+    if args.outfile == "-":
+        return args
+    infile = "stdin.png" if args.infile == "-" else args.infile
     if args.outfile is None:
         if args.number > 1:
             # multi-file output
-            args.outfile = insert_index_into_filename(args.infile)
+            args.outfile = insert_index_into_filename(infile)
         elif args.randomize:
             # single-file output, random name.
-            args.outfile = make_scrambled_filename(args.infile)
+            args.outfile = make_scrambled_filename(infile)
         else:
             # single-file output, normal name.
-            args.outfile = args.infile.rpartition(".")[0] + ".corrupt.png"
+            args.outfile = infile.rpartition(".")[0] + ".corrupt.png"
     elif args.number > 1:
         # catch ill-formatted multifile patterns
         try:
@@ -138,21 +176,565 @@ def parse_args():
     return args
 
 
-def main():
+def binary_stream(stream):
+    """Make sure that a standard stream does not translate line endings."""
+    if sys.platform == "win32":
+        import msvcrt
+        msvcrt.setmode(stream.fileno(), os.O_BINARY)
+    return stream
+
+
+def load_infile(name, passthrough=False):
+    """Load the input file; "-" means standard input."""
+    if name == "-":
+        return GlitchedPNGFile(binary_stream(sys.stdin))
+    return GlitchedPNGFile(name, passthrough)
+
+
+def make_sink(args, multiple):
+    """Open the sink for the output files requested on the command line.
+
+    If `multiple` is True and the output goes to standard output, each file is
+    preceded by its size.
+    """
+    if args.archive is None:
+        if args.outfile == "-":
+            return StreamSink(binary_stream(sys.stdout), delimit=multiple)
+        return DirectorySink()
+    sink = open_sink(args.archive)
+    if isinstance(sink, DirectorySink):
+        sys.exit("pngglitch: error: unknown archive type: {}".format(
+            args.archive))
+    return sink
+
+
+def add_archive_argument(parser):
+    """Add the --archive option to `parser`."""
+    parser.add_argument(
+        "--archive",
+        "-A",
+        dest="archive",
+        metavar="PATH",
+        action="store",
+        type=str,
+        help="Write all output files into a single archive instead. "
+        "PATH must end in .tar, .tar.gz, .tgz, .tar.bz2, .tbz2 or .zip. The "
+        "output file names are used as member names.",
+    )
+
+
+def add_threads_argument(parser):
+    """Add the --threads option to `parser`."""
+    parser.add_argument(
+        "--threads",
+        "-t",
+        dest="threads",
+        metavar="N",
+        action="store",
+        type=int,
+        default=1,
+        help="Number of threads that compress each output file. "
+        "Defaults to 1.",
+    )
+
+
+def add_progress_argument(parser):
+    """Add the --progress and --json-progress options to `parser`."""
+    parser.add_argument(
+        "--progress",
+        dest="progress",
+        action="store_const",
+        const="bar",
+        help="Show a progress bar on standard error.",
+    )
+    parser.add_argument(
+        "--json-progress",
+        dest="progress",
+        action="store_const",
+        const="json",
+        help="Report progress on standard error as one JSON object per "
+        "line.",
+    )
+
+
+# The progress stages whose end means that a copy is finished.
+COPY_STAGES = ("deflate", "unpack")
+
+
+class ProgressReporter(object):
+    """Prints `pngglitch.ProgressEvent` objects to a stream.
+
+    At most one event per `interval` seconds is printed, except that the end
+    of each stage is always printed. Copies are counted by the number of
+    finished ``"deflate"`` and ``"unpack"`` stages.
+
+    Args:
+        style (str): Either ``"bar"`` or ``"json"``.
+        copies (int): The number of output files that will be produced.
+        stream (*file*, optional): Where to print. Defaults to standard error.
+        interval (float): The minimum time between two printed events.
+
+    """
+
+    def __init__(self, style, copies, stream=None, interval=0.5):
+        self.style = style
+        self.copies = copies
+        self.stream = sys.stderr if stream is None else stream
+        self.interval = interval
+        self.copy = 0
+        self._last_time = None
+
+    def __call__(self, event):
+        now = time.time()
+        finished = event.done == event.total
+        if (not finished and self._last_time is not None
+                and now - self._last_time < self.interval):
+            return
+        self._last_time = now
+        if self.style == "json":
+            self.stream.write(json.dumps({
+                "time": now,
+                "copy": min(self.copy, self.copies - 1),
+                "copies": self.copies,
+                "stage": event.stage,
+                "done": event.done,
+                "total": event.total,
+            }, sort_keys=True) + "\n")
+        else:
+            if event.total:
+                amount = "{:3d}%".format(100 * event.done // event.total)
+            else:
+                amount = "{} bytes".format(event.done)
+            self.stream.write("\r[{}/{}] {:<7} {}\033[K".format(
+                min(self.copy + 1, self.copies), self.copies, event.stage,
+                amount))
+            if finished and event.stage in COPY_STAGES and \
+                    self.copy + 1 >= self.copies:
+                self.stream.write("\n")
+        self.stream.flush()
+        if finished and event.stage in COPY_STAGES:
+            self.copy += 1
+
+
+def parse_values(string):
+    """Parse a list or range of integers like "1,2,5" or "10:50:10".
+
+    Ranges are given as START:STOP:STEP and include STOP if the steps hit it.
+    The step defaults to 1.
+    """
+    values = []
+    for item in string.split(","):
+        bounds = item.split(":")
+        try:
+            if len(bounds) == 1:
+                values.append(int(bounds[0]))
+                continue
+            if len(bounds) > 3:
+                raise ValueError(item)
+            start, stop = int(bounds[0]), int(bounds[1])
+            step = int(bounds[2]) if len(bounds) == 3 else 1
+        except ValueError:
+            raise argparse.ArgumentTypeError(
+                "invalid list or range: {}".format(string))
+        if step <= 0:
+            raise argparse.ArgumentTypeError(
+                "range step must be positive: {}".format(item))
+        values.extend(range(start, stop + 1, step))
+    return values
+
+
+def add_grid_arguments(parser):
+    """Add the options that define a grid of glitch parameters."""
+    parser.add_argument(
+        "--num",
+        "-N",
+        dest="number",
+        action="store",
+        default=1,
+        metavar="N",
+        type=int,
+        help="Number of output files per combination of parameters. "
+        "Defaults to 1.",
+    )
+    parser.add_argument(
+        "--amount",
+        "-a",
+        dest="amount",
+        metavar="LIST",
+        action="store",
+        type=parse_values,
+        default=[100],
+        help="Values for the total number of affected bytes. "
+        "Defaults to 100.",
+    )
+    parser.add_argument(
+        "--mean",
+        "-m",
+        dest="mean",
+        metavar="LIST",
+        action="store",
+        type=parse_values,
+        default=[20],
+        help="Values for the mean glitch size in bytes. Defaults to 20.",
+    )
+    parser.add_argument(
+        "--deviation",
+        "-d",
+        dest="dev",
+        metavar="LIST",
+        action="store",
+        type=parse_values,
+        default=[5],
+        help="Values for the standard deviation of glitch size in bytes. "
+        "Defaults to 5.",
+    )
+    parser.add_argument(
+        "--seed",
+        "-s",
+        dest="seed",
+        metavar="INT",
+        action="store",
+        type=int,
+        help="Seed from which the seeds of all output files are derived. "
+        "Defaults to a random seed.",
+    )
+
+
+def parse_sweep_args(argv):
+    """Interface to the command-line of the ``sweep`` subcommand."""
+    parser = argparse.ArgumentParser(
+        prog="pngglitch sweep",
+        description="Glitch a PNG file with every combination of the given "
+        "parameters. Each parameter accepts a comma-separated list of values "
+        "and ranges START:STOP[:STEP].",
+    )
+    parser.add_argument(
+        "--outfile",
+        "-o",
+        dest="outfile",
+        action="store",
+        type=str,
+        help="Naming pattern for the output files. May contain the fields "
+        "{amount}, {mean}, {dev}, {index} and {seed}. Pass - to write all "
+        "files to standard output. Defaults to "
+        "<infile>.a{amount}.m{mean}.d{dev}.{index}.png.",
+    )
+    parser.add_argument(
+        "--manifest",
+        dest="manifest",
+        action="store",
+        type=str,
+        help="Path of the JSON manifest that maps each output file to its "
+        "parameters and seed. Defaults to <infile>.sweep.json.",
+    )
+    add_archive_argument(parser)
+    add_grid_arguments(parser)
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        dest="jobs",
+        metavar="N",
+        action="store",
+        type=int,
+        default=1,
+        help="Number of worker processes. Defaults to 1.",
+    )
+    add_threads_argument(parser)
+    parser.add_argument(
+        "infile",
+        metavar="INFILE",
+        action="store",
+        type=str,
+        help="PNG file to be corrupted. Pass - to read from standard input.",
+    )
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.threads < 1:
+        parser.error("--threads must be at least 1")
+    if args.infile == "-":
+        stem = "stdin"
+    else:
+        stem = manifest.file_stem(args.infile)
+    if args.outfile is None:
+        args.outfile = stem + ".a{amount}.m{mean}.d{dev}.{index}.png"
+    if args.manifest is None:
+        args.manifest = stem + ".sweep.json"
+    return args
+
+
+def sweep_main(argv):
+    """The main function of the ``sweep`` subcommand."""
+    args = parse_sweep_args(argv)
+    infile = load_infile(args.infile)
+    infile.threads = args.threads
+    outfiles = infile.sweep(
+        amounts=args.amount,
+        sizes=args.mean,
+        devs=args.dev,
+        copies=args.number,
+        seed=args.seed,
+        processes=args.jobs,
+    )
+    entries = []
+    with make_sink(args, multiple=True) as sink:
+        for params, outfile in outfiles:
+            name = args.outfile.format(
+                amount=params.amount,
+                mean=params.size,
+                dev=params.dev,
+                index=params.index,
+                seed=params.seed,
+            )
+            sink.add(name, outfile)
+            entries.append({
+                "file": name,
+                "amount": params.amount,
+                "mean": params.size,
+                "deviation": params.dev,
+                "seed": params.seed,
+            })
+    manifest.save({
+        "format": "pngglitch-sweep",
+        "version": manifest.VERSION,
+        "source": args.infile,
+        "files": entries,
+    }, args.manifest)
+
+
+def parse_plan_args(argv):
+    """Interface to the command-line of the ``plan`` subcommand."""
+    parser = argparse.ArgumentParser(
+        prog="pngglitch plan",
+        description="Write a job file that lists every output file of a "
+        "glitch job together with its parameters and seed. Each parameter "
+        "accepts a comma-separated list of values and ranges "
+        "START:STOP[:STEP].",
+    )
+    parser.add_argument(
+        "--outfile",
+        "-o",
+        dest="outfile",
+        action="store",
+        type=str,
+        default=manifest.DEFAULT_PATTERN,
+        help="Naming pattern for the output files. May contain the fields "
+        "{stem}, {amount}, {mean}, {dev}, {index} and {seed}, where {stem} "
+        "is the input file name without suffix. Defaults to "
+        "{stem}.a{amount}.m{mean}.d{dev}.{index}.png.",
+    )
+    add_grid_arguments(parser)
+    parser.add_argument(
+        "jobfile",
+        metavar="JOBFILE",
+        action="store",
+        type=str,
+        help="Path of the job file to write.",
+    )
+    parser.add_argument(
+        "infiles",
+        metavar="INFILE",
+        action="store",
+        nargs="+",
+        type=str,
+        help="PNG files to be corrupted.",
+    )
+    return parser.parse_args(argv)
+
+
+def plan_main(argv):
+    """The main function of the ``plan`` subcommand."""
+    args = parse_plan_args(argv)
+    seed = args.seed
+    if seed is None:
+        seed = random.getrandbits(32)
+    try:
+        plan = manifest.make_plan(
+            args.infiles,
+            amounts=args.amount,
+            sizes=args.mean,
+            devs=args.dev,
+            copies=args.number,
+            seed=seed,
+            pattern=args.outfile,
+        )
+    except ValueError as exc:
+        sys.exit("pngglitch plan: error: {}".format(exc))
+    manifest.save(plan, args.jobfile)
+
+
+def parse_shard(string):
+    """Parse a shard specification like "3/8"."""
+    try:
+        index, count = [int(part) for part in string.split("/")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid shard: {}".format(string))
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(
+            "shard index must be between 0 and {}: {}".format(
+                count - 1, string))
+    return index, count
+
+
+def parse_run_args(argv):
+    """Interface to the command-line of the ``run`` subcommand."""
+    parser = argparse.ArgumentParser(
+        prog="pngglitch run",
+        description="Produce the output files of one shard of a job file "
+        "and write a manifest of the results.",
+    )
+    parser.add_argument(
+        "--shard",
+        dest="shard",
+        metavar="I/N",
+        action="store",
+        type=parse_shard,
+        default=(0, 1),
+        help="Run the I-th of N shards, counting from 0. Defaults to 0/1, "
+        "i.e. the whole job file.",
+    )
+    parser.add_argument(
+        "--results",
+        "-r",
+        dest="results",
+        metavar="PATH",
+        action="store",
+        type=str,
+        help="Path of the result manifest. Defaults to "
+        "<jobfile>.<I>-of-<N>.json.",
+    )
+    add_archive_argument(parser)
+    add_threads_argument(parser)
+    parser.add_argument(
+        "jobfile",
+        metavar="JOBFILE",
+        action="store",
+        type=str,
+        help="Job file written by pngglitch plan.",
+    )
+    add_progress_argument(parser)
+    args = parser.parse_args(argv)
+    if args.threads < 1:
+        parser.error("--threads must be at least 1")
+    if args.results is None:
+        stem = manifest.file_stem(args.jobfile)
+        args.results = "{}.{}-of-{}.json".format(stem, *args.shard)
+    args.outfile = None
+    return args
+
+
+def run_main(argv):
+    """The main function of the ``run`` subcommand."""
+    args = parse_run_args(argv)
+    try:
+        plan = manifest.load(args.jobfile)
+    except ValueError as exc:
+        sys.exit("pngglitch run: error: {}: {}".format(args.jobfile, exc))
+    jobs = manifest.shard(plan, *args.shard)
+    progress = None
+    if args.progress is not None:
+        progress = ProgressReporter(args.progress, len(jobs))
+    with make_sink(args, multiple=True) as sink:
+        results = manifest.run_jobs(jobs, sink, args.threads, progress)
+    manifest.save(results, args.results)
+
+
+def parse_merge_args(argv):
+    """Interface to the command-line of the ``merge`` subcommand."""
+    parser = argparse.ArgumentParser(
+        prog="pngglitch merge",
+        description="Check that the result manifests of all shards cover a "
+        "job file completely and combine them into one.",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        dest="output",
+        metavar="PATH",
+        action="store",
+        type=str,
+        help="Path of the combined result manifest. Defaults to "
+        "<jobfile>.results.json.",
+    )
+    parser.add_argument(
+        "jobfile",
+        metavar="JOBFILE",
+        action="store",
+        type=str,
+        help="Job file written by pngglitch plan.",
+    )
+    parser.add_argument(
+        "results",
+        metavar="RESULTS",
+        action="store",
+        nargs="+",
+        type=str,
+        help="Result manifests written by pngglitch run.",
+    )
+    args = parser.parse_args(argv)
+    if args.output is None:
+        stem = manifest.file_stem(args.jobfile)
+        args.output = stem + ".results.json"
+    return args
+
+
+def merge_main(argv):
+    """The main function of the ``merge`` subcommand."""
+    args = parse_merge_args(argv)
+    try:
+        plan = manifest.load(args.jobfile)
+        shards = [manifest.load(path, "pngglitch-results")
+                  for path in args.results]
+        merged = manifest.merge(plan, shards)
+    except ValueError as exc:
+        sys.exit("pngglitch merge: error: {}".format(exc))
+    manifest.save(merged, args.output)
+
+
+# Subcommands by name. If the first argument is none of these, the arguments
+# are passed to `parse_args()` instead.
+COMMANDS = {
+    "sweep": sweep_main,
+    "plan": plan_main,
+    "run": run_main,
+    "merge": merge_main,
+}
+
+
+def main(argv=None):
     """The main function."""
-    args = parse_args()
-    infile = GlitchedPNGFile(args.infile)
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+    args = parse_args(argv)
+    infile = load_infile(args.infile, args.passthrough)
+    infile.threads = args.threads
+    if args.progress is not None:
+        infile.progress = ProgressReporter(args.progress, args.number)
+    raw_chunks = None
+    if args.raw is not None:
+        raw_chunks = set(args.raw.split(","))
+        if not any(len(chunk) for chunk in infile.chunks
+                   if chunk.name in raw_chunks):
+            sys.exit("pngglitch: error: --raw: no data in chunks of type "
+                     "{}".format(args.raw))
     outfiles = infile.glitch_file(
         copies=args.number,
         glitch_amount=args.amount,
         glitch_size=args.mean,
         glitch_dev=args.dev,
+        raw_chunks=raw_chunks,
     )
-    if args.number > 1:
-        for i, outfile in enumerate(outfiles):
-            outfile.write(args.outfile % i)
-    else:
-        outfiles.next().write(args.outfile)
+    with make_sink(args, multiple=args.number > 1) as sink:
+        if args.number > 1 and args.outfile != "-":
+            for i, outfile in enumerate(outfiles):
+                sink.add(args.outfile % i, outfile)
+        elif args.number > 1:
+            for outfile in outfiles:
+                sink.add(args.outfile, outfile)
+        else:
+            sink.add(args.outfile, outfiles.next())
 
 
 if __name__ == "__main__":
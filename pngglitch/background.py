@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2014–2019 Nico Madysa
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Loading and glitching PNG files without blocking the caller.
+
+Loading, glitching and compressing a large image may take seconds. Event-driven
+programs (e.g. servers built on Tornado, Twisted or Trollius) cannot afford to
+block for that long. The functions in this module move this work into an
+*executor* and hand out futures instead of results.
+
+An executor is any object with a method ``submit(fn, *args, **kwargs)`` that
+returns a future, i.e. an object with the methods ``result()``, ``done()`` and
+``cancel()``. This is the interface of `concurrent.futures` (available on
+Python 2 via the ``futures`` package), whose futures most event loops can wait
+for directly. If no executor is passed, a thread pool owned by this module is
+used. It is a `concurrent.futures.ThreadPoolExecutor` if that package is
+installed.
+
+Example::
+
+    @tornado.gen.coroutine
+    def handle_upload(path):
+        png = yield load_in_background(path)
+        for future in glitch_file_in_background(png, 200, 10.5, 3.3, 10):
+            output = yield future
+            ...
+
+"""
+
+import threading
+from multiprocessing.pool import ThreadPool
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+from . import GlitchedPNGFile, CancellationToken, GlitchCancelled
+
+# The number of threads of the default executor.
+DEFAULT_THREADS = 2
+
+_default_executor = None
+_default_executor_lock = threading.Lock()
+
+
+def load_in_background(image_name, executor=None):
+    """Load a PNG file in the background.
+
+    Args:
+        image_name (str or file): Passed to `GlitchedPNGFile`.
+        executor (*executor*, optional): The executor that loads the file.
+            Defaults to a shared thread pool.
+
+    Returns:
+        future: Resolves to the loaded `GlitchedPNGFile`. Its decompressed
+        data (see `GlitchedPNGFile.get_baseline()`) is computed as well.
+
+    """
+    if executor is None:
+        executor = get_default_executor()
+    return executor.submit(_load, image_name)
+
+
+def glitch_file_in_background(pngfile, glitch_amount, glitch_size, glitch_dev,
+                              copies=1, executor=None, max_pending=2):
+    """Produce glitched PNG files in the background.
+
+    This works like `GlitchedPNGFile.glitch_file()`, but each copy is made by
+    the executor. The returned iterator yields one future per copy, in order.
+    The image data is decompressed only once, by the first task submitted to
+    the executor. (See `GlitchedPNGFile.get_baseline()`.)
+
+    To keep finished copies from piling up in memory, at most `max_pending`
+    copies are submitted to the executor but not yet handed out by the
+    iterator. A new copy is submitted only when the consumer asks for the next
+    future. If the iterator is closed early, all outstanding copies are
+    cancelled and abandoned as soon as possible.
+
+    Args:
+        pngfile (GlitchedPNGFile): The file to glitch. It must not be modified
+            while the iteration is running.
+        glitch_amount (int): Passed to `GlitchedPNGFile.random_glitches()`.
+        glitch_size (float): Passed to `GlitchedPNGFile.random_glitches()`.
+        glitch_dev (float): Passed to `GlitchedPNGFile.random_glitches()`.
+        copies (int): The number of glitched PNG files to produce.
+        executor (*executor*, optional): The executor that produces the copies.
+            Defaults to a shared thread pool.
+        max_pending (int): The maximum number of copies that are in progress
+            or finished but not yet handed out.
+
+    Yields:
+        future: Resolves to a glitched copy of `pngfile`. Each copy uses its
+        own seed, drawn from `GlitchedPNGFile.rng`, so the result does not
+        depend on the order in which the executor runs the copies.
+
+    """
+    if executor is None:
+        executor = get_default_executor()
+    cancel = CancellationToken()
+    # Submitted first, so it runs before any copy waits for it.
+    baseline = executor.submit(pngfile.get_baseline)
+    pending = []
+    submitted = 0
+    try:
+        while submitted < copies or pending:
+            while submitted < copies and len(pending) < max_pending:
+                seed = pngfile.rng.getrandbits(32)
+                pending.append(executor.submit(
+                    _glitch, pngfile, glitch_amount, glitch_size, glitch_dev,
+                    seed, cancel, baseline))
+                submitted += 1
+            yield pending.pop(0)
+    finally:
+        if pending:
+            cancel.cancel()
+            for future in pending:
+                future.cancel()
+
+
+def get_default_executor():
+    """Return the thread pool used if no executor is passed.
+
+    It is created on the first call and has `DEFAULT_THREADS` threads.
+
+    """
+    global _default_executor  # pylint: disable=global-statement
+    with _default_executor_lock:
+        if _default_executor is None and ThreadPoolExecutor is not None:
+            _default_executor = ThreadPoolExecutor(DEFAULT_THREADS)
+        elif _default_executor is None:
+            _default_executor = _ThreadPoolExecutor(DEFAULT_THREADS)
+        return _default_executor
+
+
+def _load(image_name):
+    """Load a file and decompress its data."""
+    pngfile = GlitchedPNGFile(image_name)
+    pngfile.get_baseline()
+    return pngfile
+
+
+def _glitch(pngfile, glitch_amount, glitch_size, glitch_dev, seed, cancel,
+            baseline):
+    """Produce one copy once `baseline` is done; None if it was cancelled."""
+    baseline.result()
+    try:
+        return pngfile.glitch_copy(glitch_amount, glitch_size, glitch_dev,
+                                   seed, cancel)
+    except GlitchCancelled:
+        return None
+
+
+class _ThreadPoolExecutor(object):
+    """A minimal executor on top of `multiprocessing.pool.ThreadPool`."""
+
+    def __init__(self, threads):
+        self._pool = ThreadPool(threads)
+
+    def submit(self, func, *args, **kwargs):
+        """Schedule ``func(*args, **kwargs)`` and return a future."""
+        future = _Future()
+        self._pool.apply_async(
+            _run, (future, func, args, kwargs), callback=future.set_result)
+        return future
+
+
+def _run(future, func, args, kwargs):
+    """Call `func` unless `future` has been cancelled."""
+    if future.cancelled():
+        return None
+    try:
+        return func(*args, **kwargs)
+    except Exception as exc:  # pylint: disable=broad-except
+        future.set_exception(exc)
+        return None
+
+
+class _Future(object):
+    """The result of a call that runs in a `_ThreadPoolExecutor`."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+        self._exception = None
+        self._cancelled = False
+
+    def set_result(self, result):
+        """Store the result unless an exception is stored already."""
+        if not self._event.is_set():
+            self._result = result
+            self._event.set()
+
+    def set_exception(self, exc):
+        """Store an exception that `result()` re-raises."""
+        self._exception = exc
+        self._event.set()
+
+    def cancel(self):
+        """Prevent the call from starting if it has not started yet.
+
+        The result of a cancelled future is None.
+
+        """
+        if self._event.is_set():
+            return False
+        self._cancelled = True
+        return True
+
+    def cancelled(self):
+        """True if `cancel()` has been called successfully."""
+        return self._cancelled
+
+    def done(self):
+        """True if the call has finished."""
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the call to finish and return its result."""
+        # On Python 2, waiting without timeout is not interruptible.
+        while not self._event.wait(0.1 if timeout is None else timeout):
+            if timeout is not None:
+                raise RuntimeError("timeout while waiting for result")
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
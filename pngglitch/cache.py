@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2014–2019 Nico Madysa
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A cache of loaded and decompressed PNG files.
+
+Long-running processes that glitch the same source images again and again
+spend much of their time reading, parsing and decompressing them. This module
+keeps recently used files in memory, so that only the glitching and
+compression remain to be done::
+
+    png = load_cached("input.png")  # Loads and decompresses the file.
+    png = load_cached("input.png")  # Only makes a copy.
+
+"""
+
+import io
+import os
+import hashlib
+import threading
+import collections
+
+from . import GlitchedPNGFile
+
+#: The default memory budget of a cache in bytes.
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class DecodedImageCache(object):
+    """A least-recently-used cache of decompressed PNG files.
+
+    Files are identified by their real path, modification time and size. If
+    `by_content` is True, they are identified by a hash of their contents
+    instead; this still reads each file, but does not parse or decompress it.
+
+    When the total size of all cached files exceeds `max_bytes`, the least
+    recently used files are evicted. Files larger than `max_bytes` are never
+    cached. The cache may be shared between threads.
+
+    Args:
+        max_bytes (int): The memory budget. This counts the payload of all
+            chunks plus the decompressed data.
+        by_content (bool): If True, identify files by a hash of their
+            contents instead of path and modification time.
+
+    Attributes:
+        hits (int): How many loads could be served from the cache so far.
+        misses (int): How many loads had to read a file so far.
+        evictions (int): How many files were evicted so far.
+        nbytes (int): The total size of all cached files in bytes.
+
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, by_content=False):
+        self.by_content = by_content
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_bytes(self):
+        """int: The memory budget. Lowering it evicts files immediately."""
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, max_bytes):
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._evict()
+
+    def load(self, image_name):
+        """Load a PNG file, from the cache if possible.
+
+        Args:
+            image_name (str): Path of the PNG file to load.
+
+        Returns:
+            GlitchedPNGFile: A new copy of the file. Its decompressed data is
+            shared with the cache (see `GlitchedPNGFile.get_baseline()`), so
+            glitching it does not need to decompress it again.
+
+        """
+        if self.by_content:
+            with open(image_name, "rb") as infile:
+                contents = infile.read()
+            key = hashlib.sha256(contents).digest()
+        else:
+            stat = os.stat(image_name)
+            key = (os.path.realpath(image_name), stat.st_mtime, stat.st_size)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.hits += 1
+                self._entries[key] = entry
+                return entry[0].copy()
+            self.misses += 1
+        # Don't block other threads while decompressing.
+        if self.by_content:
+            pngfile = GlitchedPNGFile(io.BytesIO(contents))
+        else:
+            pngfile = GlitchedPNGFile(image_name)
+        size = sum(len(chunk) for chunk in pngfile.chunks)
+        size += len(pngfile.get_baseline())
+        with self._lock:
+            if size <= self._max_bytes and key not in self._entries:
+                self._entries[key] = (pngfile, size)
+                self.nbytes += size
+                self._evict()
+        return pngfile.copy()
+
+    def clear(self):
+        """Remove all files from the cache. This does not count evictions."""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _evict(self):
+        """Evict the least recently used files until the budget is met."""
+        while self.nbytes > self._max_bytes:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
+
+    def __len__(self):
+        """The number of cached files."""
+        return len(self._entries)
+
+
+#: The cache used by `load_cached()`.
+default_cache = DecodedImageCache()
+
+
+def load_cached(image_name):
+    """Load a PNG file via `default_cache`."""
+    return default_cache.load(image_name)
+
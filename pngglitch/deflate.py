@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2014–2019 Nico Madysa
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compression of image data in independent segments.
+
+`zlib.compress()` treats its input as one long stream: the compressed form of
+each byte may depend on everything that came before it. This module instead
+cuts the input into segments of fixed size and deflates each of them on its
+own, ending each one at a byte boundary. The compressed segments are then
+joined into a single valid zlib stream.
+
+This costs a little compression ratio, but segments can be compressed in
+parallel (see `compress()`), and a segment whose bytes did not change never has
+to be compressed again (see `SegmentCache`).
+
+"""
+
+import os
+import zlib
+import struct
+import hashlib
+import threading
+from multiprocessing.pool import ThreadPool
+
+#: The default number of uncompressed bytes per segment.
+SEGMENT_SIZE = 256 * 1024
+
+#: The size of the deflate window, i.e. how far back a segment may look.
+WINDOW_SIZE = 32 * 1024
+
+# The zlib header for deflate with a 32 KiB window and no preset dictionary.
+_ZLIB_HEADER = b"\x78\x9c"
+
+# An empty, fixed-Huffman deflate block with the "final block" bit set.
+_FINAL_BLOCK = b"\x03\x00"
+
+# Thread pools for `compress()`, by process ID and number of threads. A
+# forked child inherits the pools of its parent, but not their threads, so
+# it must never use them.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def compress_segment(buf, start, length, level=zlib.Z_DEFAULT_COMPRESSION,
+                     primed=False):
+    """Compress a slice of a buffer into a raw, byte-aligned deflate stream.
+
+    Args:
+        buf (bytearray): The buffer that contains the segment.
+        start (int): The offset of the segment in `buf`.
+        length (int): The length of the segment in bytes.
+        level (int): The zlib compression level.
+        primed (bool): If True, the segment may refer back to the
+            `WINDOW_SIZE` bytes before `start`. This improves compression, but
+            the result then depends on those bytes as well.
+
+    Returns:
+        str: The compressed segment. It ends on a byte boundary, but it is no
+        complete zlib stream.
+
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    if primed and start > 0:
+        # Python 2 cannot pass a preset dictionary to zlib. Instead, let the
+        # compressor see the preceding bytes and throw its output away. The
+        # decompressor has these bytes in its window already.
+        window_start = max(0, start - WINDOW_SIZE)
+        compressor.compress(buffer(buf, window_start, start - window_start))
+        compressor.flush(zlib.Z_SYNC_FLUSH)
+    data = compressor.compress(buffer(buf, start, length))
+    return data + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def adler32(buf, segment_size=SEGMENT_SIZE):
+    """Compute the Adler-32 checksum of a buffer piece by piece.
+
+    Returns:
+        int: The checksum as an unsigned 32-bit integer.
+
+    """
+    checksum = 1
+    for start in xrange(0, len(buf), segment_size):
+        checksum = zlib.adler32(buffer(buf, start, segment_size), checksum)
+    return checksum & 0xFFFFFFFF
+
+
+def join_segments(segments, checksum):
+    """Join compressed segments into one zlib stream.
+
+    Args:
+        segments (list(str)): The segments as returned by
+            `compress_segment()`, in order.
+        checksum (int): The Adler-32 checksum of the uncompressed data.
+
+    Returns:
+        str: A complete zlib stream.
+
+    """
+    trailer = [_FINAL_BLOCK, struct.pack(">I", checksum)]
+    return b"".join([_ZLIB_HEADER] + segments + trailer)
+
+
+def compress(buf, segment_size=SEGMENT_SIZE, cancel=None, threads=1,
+             progress=None):
+    """Compress a buffer segment by segment.
+
+    This is a drop-in replacement for `zlib.compress()`. Each segment is
+    primed with the bytes before it (see `compress_segment()`), so the result
+    is almost as small as that of `zlib.compress()`.
+
+    Args:
+        buf (bytearray): The data to compress.
+        segment_size (int): The number of uncompressed bytes per segment.
+        cancel (*CancellationToken*, optional): If passed, it is checked
+            before each segment, or each batch of segments if `threads` > 1.
+        threads (int): The number of threads that compress segments in
+            parallel. zlib releases the GIL while compressing, so for large
+            buffers, this scales with the number of CPU cores.
+        progress (*callable*, optional): If passed, called as
+            ``progress(done, total)`` with the number of bytes compressed so
+            far and the size of `buf`.
+
+    Raises:
+        GlitchCancelled: If `cancel` fires.
+
+    """
+    return b"".join(
+        iter_compress(buf, segment_size, cancel, threads, progress))
+
+
+def iter_compress(buf, segment_size=SEGMENT_SIZE, cancel=None, threads=1,
+                  progress=None):
+    """Like `compress()`, but yield the zlib stream piece by piece.
+
+    The whole compressed stream is never held in memory at once, and no
+    single call into zlib sees more than `segment_size` bytes. Thus, `buf`
+    may be larger than 4 GiB, e.g. an `mmap.mmap`.
+
+    Yields:
+        str: Consecutive pieces of a complete zlib stream.
+
+    """
+    yield _ZLIB_HEADER
+    starts = range(0, len(buf), segment_size)
+    batch_size = threads if threads > 1 and len(starts) > 1 else 1
+    checksum = 1
+    for i in xrange(0, len(starts), batch_size):
+        if cancel is not None:
+            cancel.check()
+        batch = starts[i:i + batch_size]
+        if batch_size > 1:
+            segments = _get_pool(threads).map(
+                lambda start: compress_segment(
+                    buf, start, segment_size, primed=True),
+                batch,
+            )
+        else:
+            segments = [compress_segment(
+                buf, batch[0], segment_size, primed=True)]
+        for start, segment in zip(batch, segments):
+            checksum = zlib.adler32(
+                buffer(buf, start, segment_size), checksum)
+            yield segment
+        if progress is not None:
+            progress(min(len(buf), batch[-1] + segment_size), len(buf))
+    yield _FINAL_BLOCK + struct.pack(">I", checksum & 0xFFFFFFFF)
+
+
+def _get_pool(threads):
+    """Return a shared thread pool with the given number of threads."""
+    key = (os.getpid(), threads)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ThreadPool(threads)
+        return _pools[key]
+
+
+class SegmentCache(object):
+    """A compressor that remembers the segments it compressed last.
+
+    Each call to `compress()` compares the buffer segment by segment with the
+    one of the previous call. Only segments whose content changed are
+    compressed again. This makes compressing a series of buffers that differ
+    only in a few places much cheaper than compressing each from scratch.
+
+    Segments are compared by their SHA-1 digests, so the cache does not keep
+    a copy of the uncompressed data.
+
+    Args:
+        segment_size (int): The number of uncompressed bytes per segment.
+
+    Attributes:
+        hits (int): How many segments could be reused so far.
+        misses (int): How many segments had to be compressed so far.
+
+    """
+
+    def __init__(self, segment_size=SEGMENT_SIZE):
+        self.segment_size = segment_size
+        self.hits = 0
+        self.misses = 0
+        self._digests = []
+        self._compressed = []
+
+    def compress(self, buf):
+        """Compress a buffer, reusing unchanged segments of the last call.
+
+        Returns:
+            str: A complete zlib stream.
+
+        """
+        digests = []
+        compressed = []
+        for i, start in enumerate(xrange(0, len(buf), self.segment_size)):
+            digest = hashlib.sha1(
+                buffer(buf, start, self.segment_size)).digest()
+            if i < len(self._digests) and self._digests[i] == digest:
+                self.hits += 1
+                compressed.append(self._compressed[i])
+            else:
+                self.misses += 1
+                compressed.append(
+                    compress_segment(buf, start, self.segment_size))
+            digests.append(digest)
+        self._digests = digests
+        self._compressed = compressed
+        return join_segments(compressed, adler32(buf, self.segment_size))
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2014–2019 Nico Madysa
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Splitting large glitch jobs into shards that run independently.
+
+A *plan* lists every output file of a job: its input file, its glitch
+parameters and its seed. Because each output file is determined by these
+alone, the plan can be cut into shards that run on different machines, in any
+order, as often as necessary. Running a shard produces a *result manifest*
+that lists the files it wrote along with their checksums. Finally, the result
+manifests of all shards are merged and checked for completeness.
+
+Plans and result manifests are stored as JSON. A plan looks like this::
+
+    {
+      "format": "pngglitch-plan",
+      "version": 1,
+      "jobs": [
+        {"id": 0, "infile": "input.png", "outfile": "input.a100.m20.d5.0.png",
+         "amount": 100, "mean": 20, "deviation": 5, "seed": 2822365037},
+        ...
+      ]
+    }
+
+A result manifest contains the list of finished jobs under the key
+``"files"``. Each entry is a job of the plan, extended by the SHA-256 digest
+of the written file under the key ``"sha256"``.
+
+``pngglitch sweep`` writes a manifest of the same kind with the format
+``"pngglitch-sweep"``. It names the input file under the key ``"source"`` and
+lists the parameters and seed of each output file under ``"files"``.
+
+"""
+
+import os
+import sys
+import json
+import random
+import hashlib
+import itertools
+
+from . import GlitchedPNGFile
+
+#: The version of the plan and result manifest formats.
+VERSION = 1
+
+#: The default naming pattern for output files of a plan.
+DEFAULT_PATTERN = "{stem}.a{amount}.m{mean}.d{dev}.{index}.png"
+
+
+def file_stem(path):
+    """Return `path` without its suffix, e.g. "a/b" for "a/b.png"."""
+    return path.rpartition(".")[0] or path
+
+
+def make_plan(infiles, amounts, sizes, devs, copies=1, seed=None,
+              pattern=DEFAULT_PATTERN):
+    """Create a plan that glitches files with a grid of parameters.
+
+    Args:
+        infiles (list(str)): Paths of the PNG files to glitch.
+        amounts (list(int)): The values to try for `glitch_amount`.
+        sizes (list(float)): The values to try for `glitch_size`.
+        devs (list(float)): The values to try for `glitch_dev`.
+        copies (int): The number of output files for each combination of
+            input file and parameters.
+        seed (*int*, optional): Seed from which the per-copy seeds are
+            derived. If not passed, a random seed is used.
+        pattern (str): Naming pattern for the output files. It may contain
+            the fields ``{stem}`` (the input path without suffix),
+            ``{amount}``, ``{mean}``, ``{dev}``, ``{index}`` and ``{seed}``.
+
+    Returns:
+        dict: The plan.
+
+    Raises:
+        ValueError: If two jobs would write the same output file.
+
+    """
+    seeder = random.Random(seed)
+    jobs = []
+    outfiles = set()
+    grid = itertools.product(infiles, amounts, sizes, devs, range(copies))
+    for job_id, (infile, amount, size, dev, index) in enumerate(grid):
+        job_seed = seeder.getrandbits(32)
+        outfile = pattern.format(
+            stem=file_stem(infile),
+            amount=amount,
+            mean=size,
+            dev=dev,
+            index=index,
+            seed=job_seed,
+        )
+        if outfile in outfiles:
+            raise ValueError("output file is not unique: {}".format(outfile))
+        outfiles.add(outfile)
+        jobs.append({
+            "id": job_id,
+            "infile": infile,
+            "outfile": outfile,
+            "amount": amount,
+            "mean": size,
+            "deviation": dev,
+            "seed": job_seed,
+        })
+    return {"format": "pngglitch-plan", "version": VERSION, "jobs": jobs}
+
+
+def shard(plan, index, count):
+    """Select the jobs of one shard of a plan.
+
+    Jobs are dealt to the shards in turns, so that each shard gets a similar
+    mix of input files and parameters.
+
+    Args:
+        plan (dict): The plan as returned by `make_plan()` or `load()`.
+        index (int): The index of the shard, between 0 and `count` - 1.
+        count (int): The total number of shards.
+
+    Returns:
+        list(dict): The jobs of the shard.
+
+    """
+    if not 0 <= index < count:
+        raise ValueError("invalid shard: {}/{}".format(index, count))
+    return plan["jobs"][index::count]
+
+
+def run_jobs(jobs, sink, threads=1, progress=None):
+    """Produce the output files of a list of jobs.
+
+    Each input file is loaded and decompressed only once.
+
+    Args:
+        jobs (list(dict)): The jobs to run, e.g. as returned by `shard()`.
+        sink (pngglitch.sinks.Sink): Where to write the output files.
+        threads (int): Passed to `GlitchedPNGFile.threads`.
+        progress (*callable*, optional): Passed to `PNGFile.progress`.
+
+    Returns:
+        dict: The result manifest.
+
+    """
+    results = []
+    by_infile = sorted(jobs, key=lambda job: (job["infile"], job["id"]))
+    groups = itertools.groupby(by_infile, lambda job: job["infile"])
+    for infile, group in groups:
+        source = GlitchedPNGFile(infile)
+        source.threads = threads
+        source.progress = progress
+        for job in group:
+            output = source.glitch_copy(
+                job["amount"], job["mean"], job["deviation"], job["seed"])
+            digest = hashlib.sha256()
+            for data in output.iter_raw():
+                digest.update(data)
+            sink.add(job["outfile"], output)
+            result = dict(job)
+            result["sha256"] = digest.hexdigest()
+            results.append(result)
+    results.sort(key=lambda result: result["id"])
+    return {"format": "pngglitch-results", "version": VERSION,
+            "files": results}
+
+
+def merge(plan, manifests):
+    """Merge the result manifests of several shards.
+
+    Shards may have been run more than once, so a job may appear in several
+    manifests. This is fine as long as all runs agree on the result.
+
+    Args:
+        plan (dict): The plan that all shards belong to.
+        manifests (list(dict)): The result manifests of the shards.
+
+    Returns:
+        dict: A single result manifest that covers the whole plan.
+
+    Raises:
+        ValueError: If a job of the plan is missing from all manifests, if a
+            manifest contains a job that is not in the plan, or if two runs
+            of the same job gave different results.
+
+    """
+    jobs = dict((job["id"], job) for job in plan["jobs"])
+    merged = {}
+    for manifest in manifests:
+        _check_format(manifest, "pngglitch-results")
+        for result in manifest["files"]:
+            job = jobs.get(result["id"])
+            if job is None or any(result.get(key) != value
+                                  for key, value in job.items()):
+                raise ValueError(
+                    "result does not match the plan: job {}".format(
+                        result["id"]))
+            previous = merged.setdefault(result["id"], result)
+            if previous["sha256"] != result["sha256"]:
+                raise ValueError(
+                    "conflicting results for job {}".format(result["id"]))
+    missing = sorted(set(jobs) - set(merged))
+    if missing:
+        raise ValueError("missing results for jobs: {}".format(
+            ", ".join(str(job_id) for job_id in missing)))
+    return {"format": "pngglitch-results", "version": VERSION,
+            "files": [merged[job_id] for job_id in sorted(merged)]}
+
+
+def load(path, expected_format="pngglitch-plan"):
+    """Load a plan or result manifest from a JSON file.
+
+    Raises:
+        ValueError: If the file is no plan or result manifest, respectively.
+
+    """
+    with open(path) as infile:
+        document = json.load(infile)
+    _check_format(document, expected_format)
+    return document
+
+
+def save(document, path):
+    """Save a plan, result manifest or sweep manifest to a JSON file.
+
+    The file is written under a temporary name first and then renamed, so an
+    interrupted run never leaves a truncated manifest behind. An existing
+    file at `path` is replaced.
+
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as outfile:
+        json.dump(document, outfile, indent=2, separators=(",", ": "),
+                  sort_keys=True)
+    # Windows cannot rename a file onto an existing one.
+    if sys.platform == "win32" and os.path.exists(path):
+        os.remove(path)
+    os.rename(temp_path, path)
+
+
+def _check_format(document, expected_format):
+    """Raise ValueError if `document` is not of the expected format."""
+    if not isinstance(document, dict) or \
+            document.get("format") != expected_format:
+        raise ValueError("not a {} file".format(expected_format))
+    if document.get("version") != VERSION:
+        raise ValueError("unsupported {} version: {}".format(
+            expected_format, document.get("version")))
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2014–2019 Nico Madysa
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Destinations for glitched PNG files.
+
+Writing many small files one by one can be slow, e.g. on network file systems.
+The sinks in this module offer a common interface to write PNG files either
+into a directory, sequentially into a single tar or zip archive, or into a
+stream such as standard output.
+
+Each sink is used like this::
+
+    with open_sink("output.tar") as sink:
+        for i, png in enumerate(infile.glitch_file(200, 10.5, 3.3, 10)):
+            sink.add("output.%d.png" % i, png)
+
+"""
+
+import os
+import abc
+import sys
+import time
+import struct
+import tarfile
+import zipfile
+import tempfile
+
+
+class Sink(object):
+    """Abstract base class of all sinks.
+
+    Sinks are context managers. Leaving the ``with`` block closes them.
+    Subclasses must implement `add()`; otherwise, they cannot be
+    instantiated.
+
+    """
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def add(self, name, pngfile):
+        """Write a PNG file into this sink.
+
+        Args:
+            name (str): The name of the file. How it is used depends on the
+                sink.
+            pngfile (PNGFile): The file to write.
+
+        """
+
+    def close(self):
+        """Finish writing. No files may be added afterwards."""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class DirectorySink(Sink):
+    """Write each PNG file into a file of its own.
+
+    Args:
+        directory (*str*, optional): The directory relative to which names are
+            interpreted. Defaults to the current working directory.
+
+    """
+
+    def __init__(self, directory=os.curdir):
+        self.directory = directory
+
+    def add(self, name, pngfile):
+        pngfile.write(os.path.join(self.directory, name))
+
+
+class TarSink(Sink):
+    """Write PNG files sequentially into a tar archive.
+
+    The archive is written as a stream. It never seeks and each PNG file is
+    serialized chunk by chunk, so the target may well be a pipe.
+
+    Args:
+        target (str or file): The path of the archive or a writable file
+            object opened in binary mode. A file object is not closed by
+            `close()`.
+        compression (*str*, optional): Either ``"gz"`` or ``"bz2"`` to
+            compress the archive. By default, it is not compressed.
+
+    """
+
+    def __init__(self, target, compression=""):
+        mode = "w|" + compression
+        if hasattr(target, "write"):
+            self._tar = tarfile.open(fileobj=target, mode=mode)
+        else:
+            self._tar = tarfile.open(target, mode=mode)
+
+    def add(self, name, pngfile):
+        info = tarfile.TarInfo(name.lstrip("/"))
+        info.size = pngfile.get_size()
+        info.mtime = time.time()
+        info.mode = 0o644
+        self._tar.addfile(info, _RawReader(pngfile))
+
+    def close(self):
+        self._tar.close()
+
+
+class ZipSink(Sink):
+    """Write PNG files into a zip archive.
+
+    The files are stored without compression because PNG data is compressed
+    already. Each file is written to a temporary file first, so that it never
+    has to be held in memory as a whole.
+
+    Note:
+        Unlike `TarSink`, this requires a seekable target.
+
+    Args:
+        target (str or file): The path of the archive or a writable, seekable
+            file object opened in binary mode. A file object is not closed by
+            `close()`.
+
+    """
+
+    def __init__(self, target):
+        self._zip = zipfile.ZipFile(
+            target, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+
+    def add(self, name, pngfile):
+        # zipfile can only stream members from a named file.
+        handle, temp_path = tempfile.mkstemp(suffix=".png")
+        try:
+            with os.fdopen(handle, "wb") as temp_file:
+                pngfile.write_to(temp_file)
+            os.chmod(temp_path, 0o644)
+            self._zip.write(temp_path, name.lstrip("/"))
+        finally:
+            os.remove(temp_path)
+
+    def close(self):
+        self._zip.close()
+
+
+class StreamSink(Sink):
+    """Write PNG files into a stream one after the other.
+
+    Names are ignored. Unless `delimit` is False, each file is preceded by its
+    size in bytes as an unsigned, big-endian 64-bit integer. This allows
+    readers to split the stream without parsing PNG chunks.
+
+    Args:
+        stream (*file*, optional): A writable file object opened in binary
+            mode. Defaults to standard output. It is flushed, but not closed
+            by `close()`.
+        delimit (bool): If False, write the files without size prefix.
+
+    """
+
+    def __init__(self, stream=None, delimit=True):
+        self.stream = sys.stdout if stream is None else stream
+        self.delimit = delimit
+
+    def add(self, name, pngfile):
+        if self.delimit:
+            self.stream.write(struct.pack(">Q", pngfile.get_size()))
+        pngfile.write_to(self.stream)
+
+    def close(self):
+        self.stream.flush()
+
+
+def open_sink(target):
+    """Pick a sink based on the name of the target.
+
+    Args:
+        target (str): ``"-"`` for standard output, a path ending in
+            ``.tar``, ``.tar.gz``, ``.tgz``, ``.tar.bz2`` or ``.zip`` for the
+            respective archive, or the path of a directory.
+
+    Returns:
+        Sink: A newly opened sink.
+
+    """
+    if target == "-":
+        return StreamSink()
+    lower = target.lower()
+    if lower.endswith(".tar"):
+        return TarSink(target)
+    if lower.endswith((".tar.gz", ".tgz")):
+        return TarSink(target, "gz")
+    if lower.endswith((".tar.bz2", ".tbz2")):
+        return TarSink(target, "bz2")
+    if lower.endswith(".zip"):
+        return ZipSink(target)
+    return DirectorySink(target)
+
+
+class _RawReader(object):
+    """Read-only file object over the serialized form of a PNG file."""
+
+    def __init__(self, pngfile):
+        self._parts = pngfile.iter_raw()
+        self._part = b""
+        self._offset = 0
+
+    def read(self, size=-1):
+        """Read up to `size` bytes; all remaining bytes if `size` < 0."""
+        pieces = []
+        while size != 0:
+            if self._offset == len(self._part):
+                self._part = next(self._parts, None)
+                self._offset = 0
+                if self._part is None:
+                    self._part = b""
+                    break
+            end = len(self._part)
+            if size > 0:
+                end = min(end, self._offset + size)
+                size -= end - self._offset
+            pieces.append(bytes(self._part[self._offset:end]))
+            self._offset = end
+        return b"".join(pieces)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2014–2019 Nico Madysa
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of the segmented compressor."""
+
+import zlib
+import random
+import unittest
+import multiprocessing
+
+from pngglitch import deflate
+
+
+def make_data(size, seed=0):
+    """Return `size` pseudo-random, compressible bytes."""
+    rng = random.Random(seed)
+    return bytearray(rng.choice((0x00, 0x01, 0x80, 0xFF))
+                     for _ in range(size))
+
+
+def _compress_in_child(size):
+    """Compress data with several threads in a worker process."""
+    return deflate.compress(make_data(size), threads=2)
+
+
+class CompressTest(unittest.TestCase):
+    """`deflate.compress()` produces valid zlib streams."""
+
+    SIZES = [
+        0,
+        1,
+        deflate.SEGMENT_SIZE - 1,
+        deflate.SEGMENT_SIZE,
+        deflate.SEGMENT_SIZE + 1,
+        2 * deflate.SEGMENT_SIZE + deflate.WINDOW_SIZE + 1,
+    ]
+    THREADS = [1, 2, 3, 4]
+
+    @classmethod
+    def setUpClass(cls):
+        largest = make_data(max(cls.SIZES))
+        cls.data = {size: largest[:size] for size in cls.SIZES}
+
+    def test_roundtrip(self):
+        for size in self.SIZES:
+            for threads in self.THREADS:
+                compressed = deflate.compress(self.data[size],
+                                              threads=threads)
+                self.assertEqual(zlib.decompress(compressed),
+                                 self.data[size], (size, threads))
+
+    def test_threads_do_not_change_output(self):
+        for size in self.SIZES:
+            results = set(deflate.compress(self.data[size], threads=threads)
+                          for threads in self.THREADS)
+            self.assertEqual(len(results), 1, size)
+
+    def test_segments_smaller_than_window(self):
+        data = self.data[max(self.SIZES)]
+        compressed = deflate.compress(
+            data, segment_size=deflate.WINDOW_SIZE // 3, threads=2)
+        self.assertEqual(zlib.decompress(compressed), data)
+
+
+class ForkTest(unittest.TestCase):
+    """Forked processes do not use the thread pools of their parent."""
+
+    def test_compress_after_fork(self):
+        size = 4 * deflate.SEGMENT_SIZE
+        expected = deflate.compress(make_data(size), threads=2)
+        pool = multiprocessing.Pool(1)
+        try:
+            result = pool.apply_async(_compress_in_child, (size,))
+            self.assertEqual(result.get(timeout=30), expected)
+        finally:
+            pool.terminate()
+
+
+if __name__ == "__main__":
+    unittest.main()
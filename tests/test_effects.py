@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2014–2019 Nico Madysa
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of the glitch effects."""
+
+import random
+import unittest
+
+import pngglitch
+
+
+def reference_move(data, length, from_, to_):
+    """Move a block the way `GlitchedPNGFile.move()` used to."""
+    data = bytearray(data)
+    block = data[from_:from_ + length]
+    del data[from_:from_ + length]
+    data[to_:to_] = block
+    return bytes(data)
+
+
+class MoveTest(unittest.TestCase):
+    """`move()` is the same as cutting out a block and reinserting it."""
+
+    SIZE = 200
+
+    def setUp(self):
+        self.rng = random.Random(0)
+        self.data = bytes(bytearray(
+            self.rng.randint(0, 255) for _ in range(self.SIZE)))
+        # Make `_shift()` copy block by block even for these small moves.
+        self.block_size = pngglitch._COPY_BLOCK_SIZE
+        pngglitch._COPY_BLOCK_SIZE = 7
+
+    def tearDown(self):
+        pngglitch._COPY_BLOCK_SIZE = self.block_size
+
+    def make_bytearray(self):
+        """Return a glitchable file whose image data is a `bytearray`."""
+        pngfile = pngglitch.GlitchedPNGFile()
+        pngfile._decompressed = bytearray(self.data)
+        return pngfile
+
+    def make_mapped(self):
+        """Return a glitchable file whose image data is memory-mapped."""
+        buf = pngglitch._MappedBuffer.new(self.SIZE)
+        buf[:] = self.data
+        pngfile = pngglitch.GlitchedPNGFile()
+        pngfile._decompressed = buf
+        return pngfile
+
+    def check_move(self, length, from_, to_):
+        expected = reference_move(self.data, length, from_, to_)
+        for make in (self.make_bytearray, self.make_mapped):
+            pngfile = make()
+            pngfile.move(length, from_, to_)
+            self.assertEqual(bytes(pngfile._decompressed[:]), expected,
+                             (make.__name__, length, from_, to_))
+
+    def test_forward(self):
+        self.check_move(30, 10, 100)
+        self.check_move(30, 10, 25)
+        self.check_move(30, 0, self.SIZE - 30)
+
+    def test_backward(self):
+        self.check_move(30, 100, 10)
+        self.check_move(30, 25, 10)
+        self.check_move(30, self.SIZE - 30, 0)
+
+    def test_in_place(self):
+        self.check_move(30, 50, 50)
+
+    def test_empty(self):
+        self.check_move(0, 50, 10)
+        self.check_move(0, 10, 50)
+
+    def test_random(self):
+        for _ in range(500):
+            length = self.rng.randint(0, self.SIZE)
+            from_ = self.rng.randint(0, self.SIZE - length)
+            to_ = self.rng.randint(0, self.SIZE - length)
+            self.check_move(length, from_, to_)
+
+
+if __name__ == "__main__":
+    unittest.main()
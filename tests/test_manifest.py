@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2014–2019 Nico Madysa
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of the plan, run and merge subcommands."""
+
+import io
+import os
+import sys
+import zlib
+import json
+import random
+import shutil
+import struct
+import tempfile
+import unittest
+
+from pngglitch import manifest
+from pngglitch.__main__ import main
+
+
+def make_png(path, width, height, seed=0):
+    """Write an RGBA PNG file with pseudo-random, compressible pixels."""
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(height):
+        row = bytearray(rng.choice((0x00, 0x40, 0x80, 0xFF))
+                        for _ in range(4 * width))
+        rows.append(b"\x00" + bytes(row))
+
+    def chunk(name, data):
+        crc = zlib.crc32(name + data) & 0xFFFFFFFF
+        return struct.pack(">I", len(data)) + name + data + \
+            struct.pack(">I", crc)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    with open(path, "wb") as outfile:
+        outfile.write(b"\x89PNG\r\n\x1a\n")
+        outfile.write(chunk(b"IHDR", header))
+        outfile.write(chunk(b"IDAT", zlib.compress(b"".join(rows))))
+        outfile.write(chunk(b"IEND", b""))
+
+
+class ShardTest(unittest.TestCase):
+    """Shards give the same files however they are run."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.infile = self.path("input.png")
+        # Large enough to be compressed in several segments.
+        make_png(self.infile, 300, 300)
+        self.jobfile = self.path("job.json")
+        main(["plan", "-N", "2", "-a", "100,400", "-s", "7", self.jobfile,
+              self.infile])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def path(self, name):
+        """Return the path of a file in the temporary directory."""
+        return os.path.join(self.tmpdir, name)
+
+    def run_shard(self, shard, results, *options):
+        """Run one shard and return its result manifest."""
+        stderr = sys.stderr
+        sys.stderr = io.BytesIO()
+        try:
+            main(["run", "--shard", shard, "-r", results] + list(options) +
+                 [self.jobfile])
+        finally:
+            sys.stderr = stderr
+        return manifest.load(results, "pngglitch-results")
+
+    def test_threads_do_not_change_output(self):
+        single = self.run_shard("1/2", self.path("single.json"), "-t", "1")
+        multi = self.run_shard("1/2", self.path("multi.json"), "-t", "4")
+        self.assertEqual(single["files"], multi["files"])
+
+    def test_progress_does_not_change_output(self):
+        quiet = self.run_shard("0/2", self.path("quiet.json"))
+        verbose = self.run_shard(
+            "0/2", self.path("verbose.json"), "--json-progress")
+        self.assertEqual(quiet["files"], verbose["files"])
+
+    def test_rerun_shards_merge(self):
+        self.run_shard("0/2", self.path("0.json"), "-t", "1")
+        self.run_shard("1/2", self.path("1.json"), "-t", "1")
+        self.run_shard("1/2", self.path("1-again.json"), "-t", "4")
+        merged = self.path("merged.json")
+        main(["merge", "-o", merged, self.jobfile, self.path("0.json"),
+              self.path("1.json"), self.path("1-again.json")])
+        with open(merged) as infile:
+            result = json.load(infile)
+        self.assertEqual(len(result["files"]), 4)
+
+    def test_rerun_replaces_results(self):
+        results = self.path("0.json")
+        first = self.run_shard("0/2", results)
+        second = self.run_shard("0/2", results)
+        self.assertEqual(first, second)
+        self.assertFalse(os.path.exists(results + ".tmp"))
+
+
+if __name__ == "__main__":
+    unittest.main()